@@ -0,0 +1,628 @@
+"""
+Asyncio engine: the poll -> parse -> deliver pipeline of main.py run as cooperatively
+scheduled tasks on one event loop instead of scheduler and worker threads.
+
+Start it with ENGINE=async (or run this file). Change detection, timeline fetches, the
+outbox writer and delivery are separate tasks connected by bounded queues, so a slow stage
+holds back the one feeding it instead of piling work up in memory. RapidAPI is called with
+aiohttp, Telegram with AsyncTeleBot and the database with an async SQLAlchemy engine.
+Accounts, scheduling, quota, rendering, dedup and the SQL itself are shared with main.py.
+"""
+import asyncio
+import json
+import random
+from contextlib import aclosing, asynccontextmanager
+from datetime import datetime
+from os import environ
+from time import perf_counter
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import aiohttp
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_helper import ApiTelegramException
+from telebot.types import InputMediaPhoto
+import main as app
+from client import RETRY_STATUSES, GOVERNED_RETRY_STATUSES, MAX_RETRY_AFTER, retry_after
+from database import DATABASE_URL, Outbox, pending_messages, ensure_default_subscriptions, flush_account_state, get_account_states
+from delivery import DeliveryWorker
+from governor import QuotaGovernor, QuotaExhausted, DETECT, TIMELINE, QUOTE
+from metrics import CycleTrace, DB_FLUSH_SECONDS, observe_parse, observe_request, start_metrics_server
+from registry import Subscription
+from twitter import (
+    HEADERS, URL, BATCH_WORKERS, FETCH_WORKERS, FETCH_TIMEOUT, QUOTE_WORKERS, PAGE_SIZE, MAX_PAGES, FETCH_MAX,
+    STREAM_TIMELINES, quote_cache, client,
+    chunk_uids, parse_tweets, status_counts_from_response, tweet_from_response, apply_quotes,
+)
+from type import Tweet
+from webhook import WebhookServer, TELEGRAM_MODE
+
+# Changed accounts waiting for a timeline fetch, and fetched accounts waiting to be written
+QUEUE_SIZE = int(environ.get("ASYNC_QUEUE_SIZE", 256))
+# Most accounts written to the outbox in one transaction
+WRITE_BATCH = int(environ.get("ASYNC_WRITE_BATCH", 100))
+# Long-polling timeout for Telegram command updates
+UPDATES_TIMEOUT = int(environ.get("ASYNC_UPDATES_TIMEOUT", 30))
+
+# Failures an async RapidAPI call can end in
+API_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, QuotaExhausted, ValueError, KeyError, TypeError)
+
+def async_database_url(url: str):
+    """
+    DATABASE_URL with an asyncio driver: asyncpg for PostgreSQL, aiosqlite for SQLite.
+    Set ASYNC_DATABASE_URL to use something else.
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == "postgresql":
+        return url.set(drivername="postgresql+asyncpg")
+    if backend == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    return url
+
+class AsyncRapidAPIClient:
+    """
+    aiohttp counterpart of client.RapidAPIClient: pooled keep-alive connections, gzip,
+    connect/read timeouts, jittered retries of 429/5xx and the same quota governor.
+    """
+    def __init__(
+        self,
+        base_url: str,
+        headers: Dict[str, Any],
+        connect_timeout: float = 5,
+        read_timeout: float = 20,
+        retries: int = 3,
+        backoff: float = 0.5,
+        pool_size: int = 16,
+        governor: Optional[QuotaGovernor] = None,
+    ):
+        self.base_url = base_url
+        self.headers = {k: v for k, v in headers.items() if v is not None}
+        self.headers["Accept-Encoding"] = "gzip, deflate"
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.governor = governor
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        # The session has to be created on the running loop
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            connector=aiohttp.TCPConnector(limit=self.pool_size),
+        )
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+    async def get(
+        self,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        priority: int = DETECT,
+    ) -> Tuple[int, Any]:
+        """
+        GET `path` relative to the base URL and return (status, parsed JSON body).
+
+        :raises governor.QuotaExhausted: If the governor refused the call.
+        :raises ValueError: If the body isn't JSON.
+        """
+        res, start = await self._send(path, params, timeout, priority)
+        async with res:
+            body = await res.read()
+        observe_request(path, res.status, perf_counter() - start, len(body))
+        return res.status, json.loads(body) if body else None
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        priority: int = DETECT,
+    ) -> AsyncIterator[aiohttp.StreamReader]:
+        """
+        Like get(), but yields the response body as a StreamReader to read incrementally.
+        Failures are only retried until a response is handed out.
+
+        :raises governor.QuotaExhausted: If the governor refused the call.
+        :raises aiohttp.ClientResponseError: If the response has an error status.
+        """
+        res, start = await self._send(path, params, timeout, priority)
+        try:
+            res.raise_for_status()
+            yield res.content
+        finally:
+            observe_request(path, res.status, perf_counter() - start, res.content.total_bytes)
+            res.close()
+
+    async def _send(
+        self,
+        path: str,
+        params: Optional[Dict[str, Any]],
+        timeout: Optional[float],
+        priority: int,
+    ) -> Tuple[aiohttp.ClientResponse, float]:
+        """
+        Send the GET with retries, like client.RapidAPIClient._send(): every attempt asks the
+        governor for quota and reports back, and 429s are left to it. Returns the final,
+        unread response with the time its attempt started.
+        """
+        params = {k: str(v) for k, v in (params or {}).items()}
+        request_timeout = aiohttp.ClientTimeout(
+            sock_connect=self.connect_timeout,
+            sock_read=timeout if timeout is not None else self.read_timeout,
+        )
+        retry_statuses = GOVERNED_RETRY_STATUSES if self.governor else RETRY_STATUSES
+        for attempt in range(self.retries + 1):
+            if self.governor:
+                self.governor.acquire(priority)
+            start = perf_counter()
+            try:
+                res = await self.session.get(self.base_url + path, params=params, timeout=request_timeout)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                observe_request(path, 0, perf_counter() - start, 0)
+                if self.governor:
+                    self.governor.record(None)
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            if self.governor:
+                self.governor.record(res.status, res.headers)
+            if res.status not in retry_statuses or attempt == self.retries:
+                return res, start
+            wait = retry_after(res.headers)
+            if wait is not None and wait > MAX_RETRY_AFTER:
+                return res, start
+            res.release()
+            observe_request(path, res.status, perf_counter() - start, 0)
+            await asyncio.sleep(wait if wait is not None else self._backoff(attempt))
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter, like client.RapidAPIClient
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+async def get_status_counts(api: AsyncRapidAPIClient, uids: List[str]) -> Dict[str, int]:
+    """
+    twitter.get_status_counts() on the event loop: one /get-users call per chunk, BATCH_WORKERS at a time.
+    """
+    limit = asyncio.Semaphore(BATCH_WORKERS)
+
+    async def chunk_counts(chunk: List[str]) -> Dict[str, int]:
+        async with limit:
+            try:
+                _, response = await api.get("/get-users", params={"users": ",".join(chunk)}, priority=DETECT)
+                return status_counts_from_response(response)
+            except API_ERRORS as e:
+                print(f"Failed to get status counts: {e}")
+                return {}
+
+    counts: Dict[str, int] = {}
+    for result in await asyncio.gather(*(chunk_counts(chunk) for chunk in chunk_uids(uids))):
+        counts.update(result)
+    return counts
+
+async def get_tweets(api: AsyncRapidAPIClient, uid: str, count: int = PAGE_SIZE, since_id: Optional[int] = None) -> Tuple[List[Tweet], int]:
+    """
+    twitter.get_tweets() on the event loop.
+
+    Raises:
+        One of API_ERRORS if the call failed, was refused, or didn't return a timeline.
+    """
+    if STREAM_TIMELINES:
+        tweets = []
+        async with aclosing(stream_tweets(api, uid, since_id, min(count, PAGE_SIZE))) as stream:
+            async for tweet in stream:
+                tweets.append(tweet)
+                if len(tweets) >= count:
+                    break
+        return tweets, 0
+    status, response = await api.get("/user-tweets", params={"user": uid, "count": count}, timeout=FETCH_TIMEOUT, priority=TIMELINE)
+    if status >= 400:
+        raise ValueError(f"/user-tweets answered {status}")
+    try:
+        start = perf_counter()
+        tweets, skipped = parse_tweets(response, since_id)
+        observe_parse(perf_counter() - start, len(tweets), skipped)
+        # The API may return more than asked for (e.g. a pinned tweet on top)
+        return tweets[:count], skipped
+    except KeyError as e:
+        raise ValueError(f"Unexpected /user-tweets response (missing {e})") from e
+
+async def stream_tweets(
+    api: AsyncRapidAPIClient,
+    uid: str,
+    since_id: Optional[int] = None,
+    page_size: int = PAGE_SIZE,
+    max_pages: int = MAX_PAGES,
+) -> AsyncIterator[Tweet]:
+    """
+    streaming.stream_tweets() on the event loop, parsing each page as it arrives with ijson.parse_async.
+
+    Raises:
+        One of API_ERRORS if a page failed, was refused, or didn't return a timeline.
+    """
+    # Imported here so ijson is only needed when streaming
+    import ijson
+    from streaming import PageParser, next_cursor, page_params
+
+    cursor = None
+    for _ in range(max_pages):
+        parser = PageParser(since_id, with_pinned=cursor is None)
+        start = perf_counter()
+        async with api.stream("/user-tweets", params=page_params(uid, page_size, cursor), timeout=FETCH_TIMEOUT, priority=TIMELINE) as body:
+            try:
+                async for prefix, event, value in ijson.parse_async(body, use_float=True):
+                    for tweet in parser.feed(prefix, event, value):
+                        yield tweet
+                    if parser.reached:
+                        break
+            except ijson.JSONError as e:
+                raise ValueError(f"Malformed /user-tweets response: {e}") from e
+            for tweet in parser.finish():
+                yield tweet
+        observe_parse(perf_counter() - start, parser.parsed, parser.skipped)
+        cursor = next_cursor(parser, cursor)
+        if cursor is None:
+            return
+
+async def resolve_quotes(api: AsyncRapidAPIClient, tweets: List[Tweet]) -> List[Tweet]:
+    """
+    twitter.resolve_quotes() on the event loop, sharing its quote cache.
+    """
+    missing = {t.quoted_id for t in tweets if t.quoted_id and quote_cache.get(t.quoted_id) is None}
+    limit = asyncio.Semaphore(QUOTE_WORKERS)
+
+    async def fetch(tweet_id: str):
+        async with limit:
+            try:
+                _, response = await api.get("/tweet", params={"pid": tweet_id}, priority=QUOTE)
+                quote_cache.set(tweet_id, tweet_from_response(tweet_id, response))
+            except API_ERRORS:
+                pass
+
+    await asyncio.gather(*(fetch(tweet_id) for tweet_id in missing))
+    return apply_quotes(tweets)
+
+class AsyncDeliveryWorker(DeliveryWorker):
+    """
+    DeliveryWorker on the event loop, sending with AsyncTeleBot. Ordering, pacing, 429 and
+    retry handling are the same; wake() starts a drain right away when new rows are written.
+    """
+    def __init__(self, bot: AsyncTeleBot, sessions: async_sessionmaker, batch_size: int = 100, idle_interval: float = 1):
+        super().__init__(bot, batch_size, idle_interval)
+        self.sessions = sessions
+        self._wake = asyncio.Event()
+
+    def wake(self):
+        self._wake.set()
+
+    async def run(self):
+        while not self.stopped.is_set():
+            try:
+                rows, sent = await self.drain()
+            except Exception as e:
+                print(f"Delivery worker failed: {e}")
+                rows, sent = 0, 0
+            if not rows:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.idle_interval)
+                except asyncio.TimeoutError:
+                    pass
+            elif not sent:
+                # Everything due is rate limited; check back shortly
+                await asyncio.sleep(0.25)
+
+    async def drain(self) -> tuple[int, int]:
+        async with self.sessions() as session:
+            rows = await session.run_sync(pending_messages, self.batch_size)
+            blocked = set()
+            sent = 0
+            for row in rows:
+                if not self._sendable(row, blocked):
+                    continue
+                while not self.global_bucket.consume():
+                    await asyncio.sleep(self.global_bucket.delay())
+                if await self._send(row):
+                    sent += 1
+                else:
+                    blocked.add(row.chat_id)
+                await session.commit()
+            return len(rows), sent
+
+    async def _send(self, row: Outbox) -> bool:
+        row.attempts += 1
+        start = perf_counter()
+        try:
+            try:
+                if row.media:
+                    await self._send_media(row.chat_id, json.loads(row.media))
+                else:
+                    await self.bot.send_message(row.chat_id, row.text, parse_mode=row.parse_mode)
+            except ApiTelegramException as e:
+                start = self._fallback(row, e, start)
+                await self.bot.send_message(row.chat_id, row.fallback_text)
+        except Exception as e:
+            return self._send_failed(row, e, start)
+        return self._sent(row, start)
+
+    async def _send_media(self, chat_id: str, urls: list[str]):
+        if len(urls) == 1:
+            await self.bot.send_photo(chat_id, urls[0])
+        else:
+            await self.bot.send_media_group(chat_id, [InputMediaPhoto(url) for url in urls])
+
+class AsyncEngine:
+    """
+    Runs the pipeline as tasks:
+
+    detect  -- every POLL_TICK, one batched /get-users pass over the due accounts; changed
+               ones go on `fetch_queue`
+    fetch   -- FETCH_WORKERS tasks fetching timelines into `write_queue`
+    write   -- resolves quotes, renders and writes outbox rows and account state for up to
+               WRITE_BATCH accounts per transaction, then wakes delivery
+    deliver -- drains the outbox into Telegram (leader only, like command handling)
+
+    Both queues are bounded: when a stage falls behind, put() blocks the stage before it.
+    An account stays out of detection while it is queued, so it's never fetched twice at once.
+    """
+    def __init__(
+        self,
+        api: AsyncRapidAPIClient,
+        bot: AsyncTeleBot,
+        sessions: async_sessionmaker,
+        queue_size: int = QUEUE_SIZE,
+        fetch_workers: int = FETCH_WORKERS,
+        write_batch: int = WRITE_BATCH,
+    ):
+        self.api = api
+        self.bot = bot
+        self.sessions = sessions
+        self.fetch_workers = fetch_workers
+        self.write_batch = write_batch
+        self.fetch_queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.write_queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.in_flight: set[str] = set()
+        self.delivery = AsyncDeliveryWorker(bot, sessions)
+        self.webhook_server: Optional[WebhookServer] = None
+        self._leader_tasks: List[asyncio.Task] = []
+        self._warm_task: Optional[asyncio.Task] = None
+
+    async def run(self):
+        await self.api.start()
+        try:
+            await self.start()
+            tasks = [
+                asyncio.create_task(self.detect_loop()),
+                asyncio.create_task(self.baseline_loop()),
+                asyncio.create_task(self.write_loop()),
+                asyncio.create_task(self.prune_loop()),
+            ]
+            tasks += [asyncio.create_task(self.fetch_worker()) for _ in range(self.fetch_workers)]
+            await asyncio.gather(*tasks)
+        finally:
+            self.deposed()
+            await self.api.close()
+            await self.bot.close_session()
+
+    async def start(self):
+        """
+        Restore state and join the cluster: main.main() for the event loop.
+        """
+        start_metrics_server()
+        await asyncio.to_thread(ensure_default_subscriptions, environ.get("CHAT_ID", ""))
+        async with self.sessions() as session:
+            await session.run_sync(app.registry.load)
+        now = datetime.utcnow()
+        app.baseline_pending.update(acc.uid for acc in app.registry.subscriptions() if app.needs_baseline(acc, now))
+        # Held so the task isn't garbage collected while the thread runs
+        self._warm_task = asyncio.create_task(asyncio.to_thread(app.delivered_index.warm))
+        # The coordinator calls back from its own thread
+        loop = asyncio.get_running_loop()
+        app.coordinator.on_elected = lambda: loop.call_soon_threadsafe(self.elected)
+        app.coordinator.on_deposed = lambda: loop.call_soon_threadsafe(self.deposed)
+        loop.run_in_executor(None, app.coordinator.run)
+
+    def elected(self):
+        """
+        Take over Telegram: outbox delivery, and commands by webhook or long polling.
+        Commands are handled by main.py's handlers on a worker thread.
+        """
+        self.delivery.stopped.clear()
+        self._leader_tasks = [asyncio.create_task(self.delivery.run()), asyncio.create_task(self.verify_channel())]
+        if TELEGRAM_MODE == "webhook":
+            try:
+                self.webhook_server = WebhookServer(app.bot)
+                self.webhook_server.start()
+                self.webhook_server.register()
+                print(f"Receiving updates by webhook on port {self.webhook_server.port}.")
+                return
+            except Exception as e:
+                print(f"Failed to start webhook, falling back to polling: {e}")
+                if self.webhook_server:
+                    self.webhook_server.stop()
+                    self.webhook_server = None
+                app.bot.remove_webhook()
+        self._leader_tasks.append(asyncio.create_task(self.command_loop()))
+
+    def deposed(self):
+        self.delivery.stop()
+        for task in self._leader_tasks:
+            task.cancel()
+        self._leader_tasks = []
+        if self.webhook_server:
+            self.webhook_server.stop()
+            self.webhook_server = None
+
+    async def command_loop(self):
+        offset = None
+        while True:
+            try:
+                updates = await self.bot.get_updates(offset=offset, timeout=UPDATES_TIMEOUT, request_timeout=UPDATES_TIMEOUT + 10)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Failed to get updates: {e}")
+                await asyncio.sleep(3)
+                continue
+            if updates:
+                offset = updates[-1].update_id + 1
+                await asyncio.to_thread(app.bot.process_new_updates, updates)
+
+    async def verify_channel(self):
+        try:
+            await self.bot.get_chat(environ.get("CHAT_ID", ""))
+            print("Channel verified.")
+        except Exception as e:
+            print(f"Failed to verify channel: {e}")
+
+    async def detect_loop(self):
+        while True:
+            try:
+                await self.detect()
+            except Exception as e:
+                print(e)
+            await asyncio.sleep(app.POLL_TICK)
+
+    async def detect(self):
+        trace = CycleTrace()
+        async with self.sessions() as session:
+            await session.run_sync(app.registry.refresh)
+        accounts = [
+            acc for acc in app.registry.subscriptions()
+            if acc.chats and app.coordinator.owns(acc.uid) and acc.uid not in app.baseline_pending
+        ]
+        app.poll_scheduler.sync(acc.uid for acc in accounts)
+        due = set(app.poll_scheduler.take())
+        # An account whose last poll is still being fetched or written is skipped; the next
+        # sync() makes it due again
+        accounts = [acc for acc in accounts if acc.uid in due and acc.uid not in self.in_flight]
+        if not accounts:
+            return
+        trace.mark("schedule")
+
+        counts = await get_status_counts(self.api, [acc.uid for acc in accounts])
+        # statuses_count goes down when tweets get deleted, so take the magnitude
+        deltas = {
+            acc.uid: abs(counts[acc.uid] - float(acc.last_count or 0))
+            for acc in accounts if acc.uid in counts
+        }
+        for uid, delta in deltas.items():
+            app.poll_scheduler.record(uid, delta > 0)
+        trace.mark("detect")
+        for acc in accounts:
+            if acc.uid not in deltas:
+                continue
+            self.in_flight.add(acc.uid)
+            if deltas[acc.uid] > 0:
+                # Blocks while the fetchers are behind
+                await self.fetch_queue.put((acc, counts[acc.uid], min(int(deltas[acc.uid]), FETCH_MAX)))
+            else:
+                # Nothing to fetch, but the poll is still recorded (last_checked)
+                await self.write_queue.put((acc, counts[acc.uid], []))
+        trace.mark("queue")
+        trace.finish()
+
+    async def fetch_worker(self):
+        while True:
+            acc, count, fetch_count = await self.fetch_queue.get()
+            try:
+                tweets, _ = await get_tweets(self.api, acc.uid, fetch_count, acc.last_id)
+            except API_ERRORS as e:
+                # Keep the old state so the change is seen again
+                print(f"Failed to fetch tweets for {acc.uid}: {e}")
+                self.in_flight.discard(acc.uid)
+                continue
+            finally:
+                self.fetch_queue.task_done()
+            await self.write_queue.put((acc, count, app.unseen_tweets(acc, tweets)))
+
+    async def write_loop(self):
+        while True:
+            batch = [await self.write_queue.get()]
+            while len(batch) < self.write_batch and not self.write_queue.empty():
+                batch.append(self.write_queue.get_nowait())
+            try:
+                await self.write(batch)
+            except Exception as e:
+                print(f"Failed to write {len(batch)} accounts: {e}")
+            finally:
+                for acc, _, _ in batch:
+                    self.in_flight.discard(acc.uid)
+                    self.write_queue.task_done()
+
+    async def write(self, batch: List[Tuple[Subscription, int, List[Tweet]]]):
+        pending = [(acc, tweets) for acc, _, tweets in batch]
+        counts = {acc.uid: count for acc, count, _ in batch}
+        await resolve_quotes(self.api, [tweet for _, tweets in pending for tweet in tweets])
+        start = perf_counter()
+        async with self.sessions() as session:
+            states, claimed = await session.run_sync(app.write_cycle, pending, counts)
+            await session.commit()
+        DB_FLUSH_SECONDS.observe(perf_counter() - start)
+        app.delivered_index.remember(claimed)
+        app.registry.apply_states(states)
+        self.delivery.wake()
+
+    async def baseline_loop(self):
+        """
+        main.refresh_baselines() on the event loop: one /get-users chunk per BASELINE_INTERVAL.
+        """
+        while app.baseline_pending:
+            delay = app.POLL_TICK
+            try:
+                async with self.sessions() as session:
+                    await session.run_sync(app.registry.refresh)
+                chunk = app.baseline_chunk()
+                if chunk:
+                    async with self.sessions() as session:
+                        current, last_ids = app.split_stale(await session.run_sync(get_account_states, chunk))
+                    counts = await get_status_counts(self.api, list(last_ids)) if last_ids else {}
+                    states = app.baseline_states(last_ids, counts)
+                    async with self.sessions() as session:
+                        await session.run_sync(flush_account_state, states)
+                        await session.commit()
+                    app.baselines_written(chunk, current, last_ids, states)
+                    delay = app.BASELINE_INTERVAL
+            except Exception as e:
+                print(e)
+            await asyncio.sleep(delay)
+
+    async def prune_loop(self):
+        while True:
+            await asyncio.sleep(24 * 60 * 60)
+            try:
+                await asyncio.to_thread(app.delivered_index.prune)
+            except Exception as e:
+                print(e)
+
+def build_engine() -> AsyncEngine:
+    if environ.get("TELEGRAM_API_URL"):
+        asyncio_helper.API_URL = environ["TELEGRAM_API_URL"].rstrip("/") + "/bot{0}/{1}"
+    engine = create_async_engine(environ.get("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL))
+    sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+    api = AsyncRapidAPIClient(
+        URL,
+        HEADERS,
+        connect_timeout=client.connect_timeout,
+        read_timeout=client.read_timeout,
+        retries=client.retries,
+        backoff=client.backoff,
+        pool_size=client.pool_size,
+        governor=client.governor,
+    )
+    bot = AsyncTeleBot(environ.get("TELEGRAM_TOKEN", ""), validate_token=False)
+    return AsyncEngine(api, bot, sessions)
+
+def run():
+    asyncio.run(build_engine().run())
+
+if __name__ == "__main__":
+    run()
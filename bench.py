@@ -0,0 +1,167 @@
+"""
+Offline benchmark for the poll -> parse -> deliver pipeline.
+
+Runs the bot against the stand-in servers in fakes.py and a throwaway SQLite database,
+with a growing number of synthetic accounts, and reports throughput, p50/p99 cycle
+latency and peak RSS for each stage.
+
+    python bench.py --accounts 10 1000 10000 --cycles 5 --latency 0.02 --rate-429 0.01
+"""
+import argparse
+import random
+import resource
+import tempfile
+from os import environ, path
+from statistics import quantiles
+from time import perf_counter, sleep
+
+def percentiles(samples: list[float]) -> tuple[float, float]:
+    if len(samples) < 2:
+        return (samples[0], samples[0]) if samples else (0, 0)
+    cuts = quantiles(samples, n=100)
+    return cuts[49], cuts[98]
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def report(name: str, count: int, samples: list[float], unit: str):
+    total = sum(samples)
+    p50, p99 = percentiles(samples)
+    rate = count / total if total else 0
+    print(f"  {name:<14} {rate:>10.1f} {unit}/s   p50 {p50 * 1000:>9.2f} ms   p99 {p99 * 1000:>9.2f} ms   peak RSS {peak_rss_mb():>7.1f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--cycles", type=int, default=3, help="poll cycles per account count")
+    parser.add_argument("--active", type=float, default=0.1, help="share of accounts posting each cycle")
+    parser.add_argument("--latency", type=float, default=0, help="seconds added to every fake API response")
+    parser.add_argument("--rate-429", type=float, default=0, help="share of fake API responses that are 429s")
+    parser.add_argument("--quota", type=int, help="RapidAPI requests the fake API allows before answering 429")
+    parser.add_argument("--fixtures", help="directory of recorded RapidAPI responses, e.g. user-tweets.json")
+    parser.add_argument("--chats", type=int, default=1, help="chats subscribed to every account")
+    parser.add_argument("--sends", type=int, default=200, help="direct send_tweet calls to time")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    from fakes import FakeRapidAPI, FakeTelegram
+    rapidapi = FakeRapidAPI(accounts=0, latency=args.latency, rate_429=args.rate_429, fixtures=args.fixtures, quota=args.quota)
+    telegram = FakeTelegram(latency=args.latency, rate_429=args.rate_429)
+
+    # Everything reads its config at import time, so set it up before importing the bot
+    environ["TWTTR_API_URL"] = rapidapi.url
+    environ["TELEGRAM_API_URL"] = telegram.url
+    environ["TELEGRAM_TOKEN"] = "0:bench"
+    environ["TWTTR_API_KEY"] = "bench"
+    environ["CHAT_ID"] = "1"
+    environ["DATABASE_URL"] = "sqlite:///" + path.join(tempfile.mkdtemp(), "bench.db")
+    # Every account is due every cycle and nothing is held back by a budget
+    for name in ("POLL_MIN_INTERVAL", "POLL_BASE_INTERVAL", "POLL_MAX_INTERVAL"):
+        environ[name] = "0"
+    environ["TWTTR_REQUESTS_PER_MINUTE"] = "100000000"
+    environ["TELEGRAM_GLOBAL_PER_SECOND"] = "100000"
+    environ["TELEGRAM_CHAT_PER_MINUTE"] = "100000000"
+
+    import main as app
+    from sqlalchemy import insert, delete
+    from database import Bot, ChatSubscription, Delivered, Outbox, SessionLocal
+    from delivery import DeliveryWorker
+    from twitter import parse_tweets, client
+
+    for size in args.accounts:
+        rapidapi.accounts.clear()
+        rapidapi.by_name.clear()
+        for i in range(size):
+            rapidapi.add_account(str(10_000_000 + i), f"bench_user_{i}")
+        # Give every account some history so timelines aren't empty
+        for account in rapidapi.accounts.values():
+            rapidapi.post(account, 5)
+
+        session = SessionLocal()
+        session.execute(delete(ChatSubscription.__table__))
+        session.execute(delete(Bot.__table__))
+        session.execute(delete(Outbox.__table__))
+        session.execute(delete(Delivered.__table__))
+        session.execute(insert(Bot.__table__), [
+            {"uid": a.uid, "username": a.screen_name, "added_by": "bench", "last_count": a.statuses_count, "active": True}
+            for a in rapidapi.accounts.values()
+        ])
+        # Every account fans out to --chats chats
+        session.execute(insert(ChatSubscription.__table__), [
+            {"uid": a.uid, "chat_id": str(chat), "added_by": "bench"}
+            for a in rapidapi.accounts.values() for chat in range(1, args.chats + 1)
+        ])
+        session.commit()
+        session.close()
+        app.registry.version = None
+        app.poll_scheduler = app.PollScheduler(app.USERS_PER_REQUEST, budget=app.governor.bucket)
+
+        print(f"{size} accounts, {args.cycles} cycles, {args.active:.0%} active, latency {args.latency * 1000:.0f} ms, 429 rate {args.rate_429:.0%}")
+        # Startup with every account's state stale: baselines go out in /get-users chunks
+        app.registry.load()
+        app.baseline_pending.update(a.uid for a in app.registry.subscriptions())
+        batches: list[float] = []
+        while app.baseline_pending:
+            start = perf_counter()
+            app.refresh_baselines()
+            batches.append(perf_counter() - start)
+        report("baselines", size, batches, "accounts")
+
+        # The first cycle only loads the poll schedule; don't time it
+        app.check_accounts()
+
+        cycles: list[float] = []
+        requests_before = rapidapi.requests
+        for _ in range(args.cycles):
+            rapidapi.tick(args.active)
+            start = perf_counter()
+            app.check_accounts()
+            cycles.append(perf_counter() - start)
+        report("check_accounts", size * args.cycles, cycles, "accounts")
+        print(f"  {'':<14} {(rapidapi.requests - requests_before) / args.cycles:>10.1f} RapidAPI requests/cycle, {rapidapi.throttled} throttled so far")
+
+        # Parse a full timeline repeatedly, quotes excluded
+        timeline = client.get("/user-tweets", params={"user": next(iter(rapidapi.accounts)), "count": 20}).json()
+        parses: list[float] = []
+        for _ in range(200):
+            start = perf_counter()
+            parse_tweets(timeline)
+            parses.append(perf_counter() - start)
+        report("parse_tweets", len(parses), parses, "timelines")
+        # The fast path: only the newest tweet is unseen
+        tweets, _ = parse_tweets(timeline)
+        since_id = int(tweets[1].tweet_id) if len(tweets) > 1 else None
+        parses = []
+        for _ in range(200):
+            start = perf_counter()
+            parse_tweets(timeline, since_id)
+            parses.append(perf_counter() - start)
+        report("  since_id", len(parses), parses, "timelines")
+
+        sends: list[float] = []
+        for i in range(args.sends):
+            start = perf_counter()
+            app.send_tweet(f"Benchmark message {i} (with *markdown* chars_!)", [], "bench_user", str(i), "now")
+            sends.append(perf_counter() - start)
+        report("send_tweet", len(sends), sends, "messages")
+
+        worker = DeliveryWorker(app.bot)
+        drains: list[float] = []
+        delivered = 0
+        while True:
+            start = perf_counter()
+            rows, sent = worker.drain()
+            if not rows:
+                break
+            drains.append(perf_counter() - start)
+            delivered += sent
+            if not sent:
+                # Every due chat is paused by an injected 429
+                sleep(0.05)
+        if drains:
+            report("outbox drain", delivered, drains, "messages")
+
+if __name__ == "__main__":
+    main()
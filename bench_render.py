@@ -0,0 +1,95 @@
+"""
+Micro-benchmark: the old inline MarkdownV2 escaping against render.py's escape_markdown,
+the single-pass alternatives (str.translate, compiled re.sub) and the render cache.
+
+    python bench_render.py --messages 20000
+"""
+import argparse
+import random
+import re
+from timeit import timeit
+
+from render import escape_markdown, render_tweet, render_cache, MARKDOWN_SPECIAL
+
+_TRANSLATE = str.maketrans({c: "\\" + c for c in MARKDOWN_SPECIAL})
+_PATTERN = re.compile("[" + re.escape(MARKDOWN_SPECIAL) + "]")
+
+def legacy_render(content: str, media: list[str], author: str, tid: str) -> str:
+    # The renderer main.send_tweet used before render.py existed
+    return f"[{author}](https://x.com/{author}/status/{tid})" + (f": {content}" + '\n' + '\n'.join(media)) \
+        .replace(".", r"\.") \
+        .replace("-", r"\-") \
+        .replace("(", r"\(") \
+        .replace(")", r"\)") \
+        .replace("#", r"\#") \
+        .replace("!", r"\!") \
+        .replace(">", r"\>") \
+        .replace("~", r"\~") \
+        .replace("`", r"\`") \
+        .replace(":", r"\:") \
+        .replace("*", r"\*") \
+        .replace("_", r"\_") \
+        .replace("[", r"\[") \
+        .replace("]", r"\]") \
+        .replace("|", r"\|") \
+        .replace("{", r"\{") \
+        .replace("}", r"\}") \
+        .replace("+", r"\+")
+
+def sample(i: int) -> tuple[str, list[str], str, str]:
+    words = ["Breaking:", "the", "rate", "(finally)", "hit", "3.5%", "-", "see", "#markets", "thread!", "@user_1", "[1/3]", "a+b=c", "~", "ok."]
+    text = " ".join(random.choice(words) for _ in range(random.randint(5, 60)))
+    media = [f"https://pbs.twimg.com/media/{i}_{j}.jpg" for j in range(random.randint(0, 2))]
+    return text, media, f"some_author_{i % 50}", str(1_800_000_000_000_000_000 + i)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    samples = [sample(i) for i in range(args.messages)]
+
+    def run_legacy():
+        for content, media, author, tid in samples:
+            legacy_render(content, media, author, tid)
+
+    def run_escape():
+        for content, media, author, tid in samples:
+            escape_markdown(f": {content}" + '\n' + '\n'.join(media))
+
+    def run_translate():
+        for content, media, author, tid in samples:
+            (f": {content}" + '\n' + '\n'.join(media)).translate(_TRANSLATE)
+
+    def run_regex():
+        for content, media, author, tid in samples:
+            _PATTERN.sub(lambda m: "\\" + m.group(), f": {content}" + '\n' + '\n'.join(media))
+
+    def run_render():
+        render_cache.clear()
+        for content, media, author, tid in samples:
+            render_tweet(content, media, author, tid, "")
+
+    def run_cached():
+        for content, media, author, tid in samples:
+            render_tweet(content, media, author, tid, "")
+
+    legacy = timeit(run_legacy, number=3) / 3
+    results = [
+        ("legacy .replace() chain", legacy),
+        ("escape_markdown", timeit(run_escape, number=3) / 3),
+        ("str.translate", timeit(run_translate, number=3) / 3),
+        ("re.sub", timeit(run_regex, number=3) / 3),
+        ("render_tweet (cold)", timeit(run_render, number=3) / 3),
+    ]
+    # Warm the cache with every sample, then time repeat renders
+    render_cache.maxsize = max(render_cache.maxsize, args.messages)
+    run_render()
+    results.append(("render_tweet (cached)", timeit(run_cached, number=3) / 3))
+
+    for name, seconds in results:
+        print(f"{name:<24} {args.messages / seconds:>12.0f} msgs/s   {seconds / args.messages * 1e6:>7.2f} us/msg   {legacy / seconds:>5.1f}x")
+
+if __name__ == "__main__":
+    main()
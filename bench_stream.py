@@ -0,0 +1,54 @@
+"""
+Micro-benchmark: parsing one large /user-tweets body with json.loads + parse_tweets against
+streaming.py's incremental ijson parse, in time and peak memory.
+
+    python bench_stream.py --tweets 5000
+"""
+import argparse
+import io
+import json
+import random
+import tracemalloc
+from time import perf_counter
+
+from fakes import FakeRapidAPI
+from streaming import PageParser, iter_page
+from twitter import parse_tweets
+
+def measure(fn) -> tuple[float, float, int]:
+    tracemalloc.start()
+    start = perf_counter()
+    parsed = fn()
+    seconds = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak / 2**20, parsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tweets", type=int, default=5000, help="entries in the response body")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    api = FakeRapidAPI(accounts=1, keep=args.tweets)
+    account = next(iter(api.accounts.values()))
+    api.post(account, args.tweets)
+    body = json.dumps(api._timeline(account, args.tweets, None)).encode()
+    api.stop()
+
+    def loaded():
+        tweets, _ = parse_tweets(json.loads(io.BytesIO(body).read()))
+        return len(tweets)
+
+    def streamed():
+        # Tweets are consumed one by one, as a delivery pipeline would
+        return sum(1 for _ in iter_page(io.BytesIO(body), PageParser()))
+
+    print(f"{args.tweets} tweets, {len(body) / 2**20:.1f} MiB body")
+    for name, fn in (("json.loads + parse_tweets", loaded), ("ijson streaming", streamed)):
+        seconds, peak, parsed = measure(fn)
+        print(f"{name:<28} {seconds * 1000:8.1f} ms  peak {peak:7.2f} MiB  {parsed} tweets")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import random
+import requests
+from contextlib import contextmanager
+from time import perf_counter, sleep
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+from urllib3.util.retry import Retry
+from typing import BinaryIO, Dict, Any, Iterator, Optional, Tuple
+from metrics import observe_request
+from governor import QuotaGovernor, DETECT
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# With a governor 429s aren't retried: it pauses every call until the reported reset instead
+GOVERNED_RETRY_STATUSES = (500, 502, 503, 504)
+# A Retry-After longer than this many seconds isn't waited for; the response is returned as is
+MAX_RETRY_AFTER = 30
+
+class JitterRetry(Retry):
+    """
+    urllib3 Retry with full jitter on the exponential backoff, so concurrent
+    workers that hit the same 429 don't all retry in lockstep.
+    Retry-After headers still take precedence.
+    """
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff > 0 else 0
+
+class RapidAPIClient:
+    """
+    Shared HTTP client for one RapidAPI host.
+    
+    Wraps a requests.Session so every call reuses pooled keep-alive connections,
+    asks for gzip, has a connect/read timeout and retries 429/5xx with jittered backoff.
+    The session is safe to share between the worker threads in twitter.py.
+    With a `governor`, the retries happen here instead of in urllib3 so that every attempt
+    first asks it for quota and reports back how it went, and 429s are left to it.
+    """
+    def __init__(
+        self,
+        base_url: str,
+        headers: Dict[str, Any],
+        connect_timeout: float = 5,
+        read_timeout: float = 20,
+        retries: int = 3,
+        backoff: float = 0.5,
+        pool_size: int = 16,
+        governor: Optional[QuotaGovernor] = None,
+    ):
+        self.base_url = base_url
+        self.governor = governor
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self.session.headers.update({k: v for k, v in headers.items() if v is not None})
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+        self.session.headers["Connection"] = "keep-alive"
+        retry = JitterRetry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0 if governor else retry, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def timeout(self, read_timeout: Optional[float] = None) -> Tuple[float, float]:
+        return (self.connect_timeout, read_timeout if read_timeout is not None else self.read_timeout)
+
+    def get(
+        self,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        priority: int = DETECT,
+    ) -> requests.Response:
+        """
+        GET `path` relative to the client's base URL.
+        
+        :param timeout: Optional read timeout overriding the client default, in seconds.
+        :param priority: governor.DETECT, TIMELINE or QUOTE; lower priorities are refused first.
+        :raises governor.QuotaExhausted: If the governor refused the call.
+        """
+        res, start = self._send(path, params, timeout, priority)
+        observe_request(path, res.status_code, perf_counter() - start, len(res.content))
+        return res
+
+    @contextmanager
+    def stream(
+        self,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        priority: int = DETECT,
+    ) -> Iterator[BinaryIO]:
+        """
+        Like get(), but yields the decoded response body as a file to read incrementally
+        instead of loading it. The response is closed when the block exits.
+        
+        :raises requests.HTTPError: If the response has an error status.
+        :raises requests.RequestException: If reading the body fails.
+        :raises governor.QuotaExhausted: If the governor refused the call.
+        """
+        res, start = self._send(path, params, timeout, priority, stream=True)
+        try:
+            res.raise_for_status()
+            res.raw.decode_content = True
+            yield res.raw
+        # Errors while the body is read come from urllib3; map them as requests' iter_content() does
+        except ProtocolError as e:
+            raise requests.exceptions.ChunkedEncodingError(e) from e
+        except ReadTimeoutError as e:
+            raise requests.exceptions.ConnectionError(e) from e
+        finally:
+            # tell() counts the bytes read off the wire so far
+            observe_request(path, res.status_code, perf_counter() - start, res.raw.tell())
+            res.close()
+
+    def _send(
+        self,
+        path: str,
+        params: Optional[Dict[str, Any]],
+        timeout: Optional[float],
+        priority: int,
+        stream: bool = False,
+    ) -> Tuple[requests.Response, float]:
+        """
+        Send the GET, retrying it here when there is a governor, and return the final
+        response with the time its attempt started.
+        """
+        attempts = self.retries + 1 if self.governor else 1
+        for attempt in range(attempts):
+            if self.governor:
+                self.governor.acquire(priority)
+            start = perf_counter()
+            try:
+                res = self.session.get(self.base_url + path, params=params, timeout=self.timeout(timeout), stream=stream)
+            except requests.RequestException:
+                observe_request(path, 0, perf_counter() - start, 0)
+                if self.governor:
+                    self.governor.record(None)
+                if attempt == attempts - 1:
+                    raise
+                sleep(self._backoff(attempt))
+                continue
+            if self.governor:
+                self.governor.record(res.status_code, res.headers)
+            if res.status_code not in GOVERNED_RETRY_STATUSES or attempt == attempts - 1:
+                return res, start
+            wait = retry_after(res.headers)
+            if wait is not None and wait > MAX_RETRY_AFTER:
+                return res, start
+            observe_request(path, res.status_code, perf_counter() - start, 0 if stream else len(res.content))
+            res.close()
+            sleep(wait if wait is not None else self._backoff(attempt))
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter, like JitterRetry
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def close(self):
+        self.session.close()
+
+def retry_after(headers) -> Optional[float]:
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
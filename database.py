@@ -1,7 +1,8 @@
-from sqlalchemy import create_engine, Column, String, DateTime, Boolean, Numeric
+from sqlalchemy import create_engine, inspect, text, MetaData, Column, String, DateTime, Boolean, Numeric, Integer, BigInteger, Text, ForeignKey, update, insert, select, exists, literal, bindparam, or_
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+import json
 from datetime import datetime
 from os import environ
 from dotenv import load_dotenv
@@ -33,22 +34,136 @@ class Bot(Base):
     username = Column(String)
     added_by = Column(String)
     last_count = Column(Numeric)
-    last_checked = Column(DateTime, default=datetime.now, onupdate=datetime.now)
-    last_id = Column(String)
+    last_checked = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Newest delivered tweet id. Databases from before it was an integer are migrated by migrate_last_id()
+    last_id = Column(BigInteger)
     added = Column(DateTime, default=datetime.now)
     active = Column(Boolean, default=True)
 
+class ChatSubscription(Base):
+    """
+    Which chats receive an account's tweets. An account is polled once (its `bot` row is
+    active) as long as at least one chat subscribes to it.
+    """
+    __tablename__ = "subscription"
+
+    uid = Column(String, ForeignKey("bot.uid"), primary_key=True)
+    chat_id = Column(String, primary_key=True)
+    added_by = Column(String)
+    added = Column(DateTime, default=datetime.now)
+
+class Outbox(Base):
+    """
+    Rendered messages waiting to be sent by the delivery worker.
+    A row is done once `delivered` is set; `error` is filled in if it was given up on.
+    """
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column(String, nullable=False)
+    tweet_id = Column(String)
+    text = Column(Text, nullable=False)
+    fallback_text = Column(Text)
+    parse_mode = Column(String)
+    # JSON list of media URLs, sent as a photo or media group instead of text
+    media = Column(Text)
+    created = Column(DateTime, default=datetime.utcnow)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt = Column(DateTime)
+    delivered = Column(DateTime, index=True)
+    error = Column(Text)
+
+class Delivered(Base):
+    """
+    Every (chat, tweet) pair that has been queued for delivery. The primary key makes a
+    second claim on the same pair a no-op, whichever worker or restart it comes from.
+    """
+    __tablename__ = "delivered"
+
+    chat_id = Column(String, primary_key=True)
+    tweet_id = Column(BigInteger, primary_key=True)
+    delivered = Column(DateTime, default=datetime.utcnow, index=True)
+
+class Worker(Base):
+    """
+    One row per running bot process; a worker whose heartbeat goes stale is considered dead.
+    """
+    __tablename__ = "worker"
+
+    id = Column(String, primary_key=True)
+    started = Column(DateTime, default=datetime.utcnow)
+    heartbeat = Column(DateTime, index=True)
+
+class Lease(Base):
+    """
+    A named, expiring lock. Used so only one worker owns Telegram command polling and delivery.
+    """
+    __tablename__ = "lease"
+
+    name = Column(String, primary_key=True)
+    owner = Column(String)
+    expires = Column(DateTime)
+
+class Version(Base):
+    """
+    Named counters bumped by writers so other processes can tell their cached copy is stale.
+    """
+    __tablename__ = "version"
+
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+SUBSCRIPTIONS = "subscriptions"
+
+def migrate_last_id():
+    """
+    Convert a bot.last_id column created as text into the BIGINT the code compares and writes.
+    Values that aren't tweet ids become NULL. Databases other than PostgreSQL and SQLite have
+    to be migrated by hand, and refuse to start until they are.
+    """
+    column = next(c for c in inspect(engine).get_columns("bot") if c["name"] == "last_id")
+    if isinstance(column["type"], Integer):
+        return
+    print(f"Migrating bot.last_id from {column['type']} to BIGINT...")
+    dialect = engine.dialect.name
+    with engine.begin() as conn:
+        if dialect == "postgresql":
+            conn.execute(text(
+                "ALTER TABLE bot ALTER COLUMN last_id TYPE BIGINT "
+                "USING CASE WHEN last_id ~ '^[0-9]+$' THEN last_id::bigint END"
+            ))
+        elif dialect == "sqlite":
+            # SQLite can't change a column's type: copy into a new table and swap it in
+            columns = [c.name for c in Bot.__table__.columns]
+            copied = ", ".join(
+                "CASE WHEN last_id GLOB '[0-9]*' AND last_id NOT GLOB '*[^0-9]*' THEN CAST(last_id AS INTEGER) END"
+                if name == "last_id" else name
+                for name in columns
+            )
+            Bot.__table__.to_metadata(MetaData(), name="bot_new").create(conn)
+            conn.execute(text(f"INSERT INTO bot_new ({', '.join(columns)}) SELECT {copied} FROM bot"))
+            conn.execute(text("DROP TABLE bot"))
+            conn.execute(text("ALTER TABLE bot_new RENAME TO bot"))
+        else:
+            raise RuntimeError(
+                f"bot.last_id is {column['type']} but must be BIGINT; convert it "
+                "(e.g. ALTER TABLE bot ALTER COLUMN last_id TYPE BIGINT) before starting"
+            )
+
 # Create tables if they do not already exist
 Base.metadata.create_all(bind=engine)
+migrate_last_id()
 
-def add_watched_account(uid: str, executor: str, user: dict | None = None):
+def add_watched_account(uid: str, executor: str, user: dict | None = None, chat_id: str | None = None):
     """
     Add a watched account to the database.
     
     :param uid: The user's unique identifier (as a string).
     :param executor: The user or system that triggered the addition.
     :param user: A dictionary of user data (optional). If not provided, get_user_info(uid) is called.
+    :param chat_id: The chat subscribing to the account (optional).
     :raises ValueError: If unable to retrieve user info or add the record.
+    :return: The new subscriptions version.
     """
     if user is None:
         user = get_user_info(uid)
@@ -62,15 +177,268 @@ def add_watched_account(uid: str, executor: str, user: dict | None = None):
             username=user["legacy"]["screen_name"],
             added_by=executor,
             last_count=user["legacy"]["statuses_count"],
-            last_checked=datetime.now(),
+            last_checked=datetime.utcnow(),
             added=datetime.now(),
             active=True
         )
         session.add(new_bot)
+        if chat_id is not None:
+            session.flush()
+            add_subscription(session, uid, chat_id, executor)
+        version = bump_version(session)
         session.commit()
+        return version
     except SQLAlchemyError as e:
         session.rollback()
         # You can log the exception here or handle it further
         raise ValueError(f"Failed to add account: {e}") from e
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
+
+def add_subscription(session: Session, uid: str, chat_id: str, executor: str | None = None) -> bool:
+    """
+    Subscribe a chat to an account in the caller's transaction and make sure the account is polled.
+    Returns False if the chat was already subscribed.
+    """
+    chat_id = str(chat_id)
+    reactivate_accounts(session, [uid])
+    if session.get(ChatSubscription, (uid, chat_id)) is not None:
+        return False
+    session.add(ChatSubscription(uid=uid, chat_id=chat_id, added_by=executor, added=datetime.now()))
+    return True
+
+def reactivate_accounts(session: Session, uids: list[str]) -> set[str]:
+    """
+    Make sure accounts are polled, in the caller's transaction. Accounts that were inactive
+    restart from a fresh baseline (no last_id, checked now), so the tweets they posted while
+    no chat subscribed aren't sent. Returns the uids that were reactivated.
+    """
+    if not uids:
+        return set()
+    inactive = set(session.scalars(
+        select(Bot.uid).where(Bot.uid.in_(uids), or_(Bot.active == False, Bot.active.is_(None)))
+    ))
+    if inactive:
+        session.execute(
+            update(Bot.__table__).where(Bot.uid.in_(inactive))
+                .values(active=True, last_id=None, last_checked=datetime.utcnow())
+        )
+    return inactive
+
+def upsert_watched_accounts(session: Session, accounts: list[dict], executor: str, chat_id: str | None = None) -> tuple[set[str], set[str]]:
+    """
+    Insert or reactivate many watched accounts, and subscribe a chat to all of them, in the
+    caller's transaction with one statement per kind of change instead of one per account.
+    
+    :param accounts: Dicts with uid, username and last_count.
+    :param executor: The user or system that triggered the import.
+    :param chat_id: The chat subscribing to the accounts (optional).
+    :return: (uids that were inserted, uids the chat newly subscribed to).
+    """
+    by_uid = {account["uid"]: account for account in accounts}
+    if not by_uid:
+        return set(), set()
+    uids = list(by_uid)
+    existing = set(session.scalars(select(Bot.uid).where(Bot.uid.in_(uids))))
+    now, checked = datetime.now(), datetime.utcnow()
+    added = [uid for uid in uids if uid not in existing]
+    if added:
+        session.execute(insert(Bot.__table__), [
+            {
+                "uid": uid,
+                "username": by_uid[uid]["username"],
+                "added_by": executor,
+                "last_count": by_uid[uid]["last_count"],
+                "last_checked": checked,
+                "added": now,
+                "active": True,
+            }
+            for uid in added
+        ])
+    reactivate_accounts(session, list(existing))
+    if chat_id is None:
+        return set(added), set()
+    chat_id = str(chat_id)
+    subscribed = set(session.scalars(
+        select(ChatSubscription.uid).where(ChatSubscription.chat_id == chat_id, ChatSubscription.uid.in_(uids))
+    ))
+    new_subs = [uid for uid in uids if uid not in subscribed]
+    if new_subs:
+        session.execute(insert(ChatSubscription.__table__), [
+            {"uid": uid, "chat_id": chat_id, "added_by": executor, "added": now}
+            for uid in new_subs
+        ])
+    return set(added), set(new_subs)
+
+def remove_subscription(session: Session, uid: str, chat_id: str) -> int:
+    """
+    Unsubscribe a chat from an account in the caller's transaction. The account stops being
+    polled once no chat subscribes to it. Returns how many chats are still subscribed.
+    """
+    session.query(ChatSubscription) \
+        .filter(ChatSubscription.uid == uid, ChatSubscription.chat_id == str(chat_id)) \
+        .delete(synchronize_session=False)
+    remaining = session.query(ChatSubscription).filter(ChatSubscription.uid == uid).count()
+    if not remaining:
+        session.query(Bot).filter(Bot.uid == uid).update({"active": False}, synchronize_session=False)
+    return remaining
+
+def ensure_default_subscriptions(chat_id: str):
+    """
+    Subscribe `chat_id` to every active account that no chat subscribes to yet,
+    e.g. accounts added before per-chat subscriptions existed.
+    """
+    if not chat_id:
+        return
+    session = SessionLocal()
+    try:
+        orphans = select(Bot.uid, literal(str(chat_id)), literal("CHAT_ID"), literal(datetime.now())) \
+            .where(Bot.active == True) \
+            .where(~exists().where(ChatSubscription.uid == Bot.uid))
+        session.execute(
+            insert(ChatSubscription.__table__).from_select(["uid", "chat_id", "added_by", "added"], orphans)
+        )
+        bump_version(session)
+        session.commit()
+    except IntegrityError:
+        # Another worker backfilled them at the same time
+        session.rollback()
+    finally:
+        session.close()
+
+def bump_version(session: Session, name: str = SUBSCRIPTIONS) -> int:
+    """
+    Increment a version counter in the caller's transaction and return its new value.
+    """
+    updated = session.query(Version) \
+        .filter(Version.name == name) \
+        .update({"value": Version.value + 1}, synchronize_session=False)
+    if not updated:
+        session.add(Version(name=name, value=1))
+        session.flush()
+    return session.query(Version.value).filter(Version.name == name).scalar()
+
+def get_version(session: Session, name: str = SUBSCRIPTIONS) -> int:
+    return session.query(Version.value).filter(Version.name == name).scalar() or 0
+
+def get_account_states(session: Session, uids: list[str]):
+    """
+    The stored poll state (uid, last_id, last_count, last_checked) of the given accounts.
+    """
+    return session.execute(
+        select(Bot.uid, Bot.last_id, Bot.last_count, Bot.last_checked).where(Bot.uid.in_(uids))
+    ).all()
+
+def flush_account_state(session: Session, states: list[dict]):
+    """
+    Write the per-account state gathered during a poll cycle as a single executemany UPDATE.
+    The caller owns the transaction and commits it.
+    
+    :param session: The session whose transaction the update joins.
+    :param states: One dict per account with uid, last_id, last_count and last_checked.
+        Values are absolute, and a row is only updated if last_id doesn't move backwards,
+        so replaying a flush (or applying one from an older cycle) can't cause resends.
+    """
+    if not states:
+        return
+    table = Bot.__table__
+    new_id = bindparam("b_last_id", type_=BigInteger)
+    not_older = or_(table.c.last_id.is_(None), table.c.last_id <= new_id)
+    stmt = update(table) \
+        .where(table.c.uid == bindparam("b_uid")) \
+        .where(not_older) \
+        .values(
+            last_id=new_id,
+            last_count=bindparam("b_last_count"),
+            last_checked=bindparam("b_last_checked"),
+        )
+    session.execute(stmt, [
+        {
+            "b_uid": state["uid"],
+            "b_last_id": state["last_id"],
+            "b_last_count": state["last_count"],
+            "b_last_checked": state["last_checked"],
+        }
+        for state in states
+    ])
+
+def enqueue_messages(session: Session, messages: list[dict]):
+    """
+    Append rendered messages to the outbox in the caller's transaction.
+    
+    :param messages: Dicts with chat_id, text and optionally tweet_id, fallback_text, parse_mode and media.
+    """
+    if not messages:
+        return
+    now = datetime.utcnow()
+    session.execute(insert(Outbox.__table__), [
+        {
+            "chat_id": str(message["chat_id"]),
+            "tweet_id": message.get("tweet_id"),
+            "text": message["text"],
+            "fallback_text": message.get("fallback_text"),
+            "parse_mode": message.get("parse_mode"),
+            "media": json.dumps(message["media"]) if message.get("media") else None,
+            "created": now,
+            "attempts": 0,
+        }
+        for message in messages
+    ])
+
+def pending_messages(session: Session, limit: int = 100) -> list[Outbox]:
+    """
+    Oldest undelivered outbox rows that are due for a (re)try.
+    """
+    now = datetime.utcnow()
+    return session.query(Outbox) \
+        .filter(Outbox.delivered.is_(None)) \
+        .filter(or_(Outbox.next_attempt.is_(None), Outbox.next_attempt <= now)) \
+        .order_by(Outbox.id) \
+        .limit(limit) \
+        .all()
+
+def claim_deliveries(session: Session, pairs: list[tuple[str, int]]) -> set[tuple[str, int]]:
+    """
+    Record (chat_id, tweet_id) pairs as delivered in the caller's transaction and return the
+    ones that weren't already. Only the claimed pairs should be enqueued; a concurrent claim
+    of the same pair waits on this transaction and then comes back empty.
+    """
+    if not pairs:
+        return set()
+    now = datetime.utcnow()
+    rows = [{"chat_id": str(chat_id), "tweet_id": int(tweet_id), "delivered": now} for chat_id, tweet_id in set(pairs)]
+    table = Delivered.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        # Imported here so startup only pays for the dialect actually in use
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(table).values(rows) \
+            .on_conflict_do_nothing(index_elements=["chat_id", "tweet_id"]) \
+            .returning(table.c.chat_id, table.c.tweet_id)
+        return {(chat_id, tweet_id) for chat_id, tweet_id in session.execute(stmt)}
+    # Other databases: look the pairs up first, then insert the rest
+    existing = set(session.execute(
+        select(table.c.chat_id, table.c.tweet_id)
+        .where(table.c.tweet_id.in_({row["tweet_id"] for row in rows}))
+    ).all())
+    rows = [row for row in rows if (row["chat_id"], row["tweet_id"]) not in existing]
+    if rows:
+        session.execute(insert(table), rows)
+    return {(row["chat_id"], row["tweet_id"]) for row in rows}
+
+def recent_deliveries(session: Session, limit: int) -> list[tuple[str, int]]:
+    """
+    The most recently claimed (chat_id, tweet_id) pairs, newest first.
+    """
+    return [tuple(row) for row in session.execute(
+        select(Delivered.chat_id, Delivered.tweet_id).order_by(Delivered.delivered.desc()).limit(limit)
+    )]
+
+def prune_deliveries(session: Session, before: datetime) -> int:
+    """
+    Forget pairs claimed before `before`; tweets that old are behind every account's last_id.
+    """
+    return session.query(Delivered).filter(Delivered.delivered < before).delete(synchronize_session=False)
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+from os import environ
+from typing import Iterable
+from sqlalchemy.orm import Session
+from cache import TTLCache
+from database import SessionLocal, claim_deliveries, recent_deliveries, prune_deliveries
+
+# (chat, tweet) pairs remembered in memory so repeats are dropped without asking the database
+DEDUP_CACHE_SIZE = int(environ.get("DEDUP_CACHE_SIZE", 100_000))
+# Days a delivered pair is kept in the database
+DEDUP_RETENTION_DAYS = float(environ.get("DEDUP_RETENTION_DAYS", 30))
+
+class DeliveredIndex:
+    """
+    Which tweets each chat has already been sent, so nothing is delivered twice across
+    restarts, baseline resets and workers polling the same account during a handover.
+
+    The `delivered` table is the source of truth; a bounded LRU in front of it answers
+    for recently seen pairs. Pairs that miss the LRU are claimed in the same transaction
+    that enqueues their messages, so checking them costs no extra round trip.
+    """
+    def __init__(self, maxsize: int = DEDUP_CACHE_SIZE):
+        self._seen = TTLCache(maxsize)
+
+    def unseen(self, pairs: Iterable[tuple[str, int]]) -> list[tuple[str, int]]:
+        """
+        Drop the pairs this process already knows were delivered.
+        """
+        return [pair for pair in pairs if pair not in self._seen]
+
+    def claim(self, session: Session, pairs: list[tuple[str, int]]) -> set[tuple[str, int]]:
+        """
+        Claim pairs in the caller's transaction and return the ones nobody had claimed yet.
+        Call remember() once the transaction has committed.
+        """
+        pairs = self.unseen(pairs)
+        claimed = claim_deliveries(session, pairs)
+        # Pairs someone else already claimed can be cached right away
+        self.remember(pair for pair in pairs if pair not in claimed)
+        return claimed
+
+    def remember(self, pairs: Iterable[tuple[str, int]]):
+        for pair in pairs:
+            self._seen.set(pair, True)
+
+    def warm(self):
+        """
+        Preload the most recent deliveries so a restarted worker skips them without a lookup.
+        """
+        session = SessionLocal()
+        try:
+            pairs = recent_deliveries(session, self._seen.maxsize)
+        finally:
+            session.close()
+        # Oldest first, so the newest end up most recently used
+        self.remember(reversed(pairs))
+
+    def prune(self, retention_days: float = DEDUP_RETENTION_DAYS) -> int:
+        session = SessionLocal()
+        try:
+            removed = prune_deliveries(session, datetime.utcnow() - timedelta(days=retention_days))
+            session.commit()
+            return removed
+        finally:
+            session.close()
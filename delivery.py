@@ -0,0 +1,164 @@
+import json
+from datetime import datetime, timedelta
+from os import environ
+from threading import Event
+from time import monotonic, perf_counter
+from telebot import TeleBot
+from telebot.apihelper import ApiTelegramException
+from telebot.types import InputMediaPhoto
+from database import SessionLocal, Outbox, pending_messages
+from ratelimit import TokenBucket
+from metrics import observe_send, observe_delivery
+
+# Telegram allows ~30 messages/s overall and ~20 messages/min into a single group.
+GLOBAL_PER_SECOND = float(environ.get("TELEGRAM_GLOBAL_PER_SECOND", 30))
+CHAT_PER_MINUTE = float(environ.get("TELEGRAM_CHAT_PER_MINUTE", 20))
+MAX_ATTEMPTS = int(environ.get("OUTBOX_MAX_ATTEMPTS", 8))
+
+class DeliveryWorker:
+    """
+    Drains the outbox table into Telegram.
+    
+    Sends are throttled by a global and a per-chat token bucket, a 429 pauses the chat for
+    `retry_after` seconds, and each row is marked delivered in its own commit so messages
+    survive restarts. Messages to the same chat are always sent in outbox order.
+    """
+    def __init__(self, bot: TeleBot, batch_size: int = 100, idle_interval: float = 1):
+        self.bot = bot
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+        self.global_bucket = TokenBucket(GLOBAL_PER_SECOND, GLOBAL_PER_SECOND)
+        self.chat_buckets: dict[str, TokenBucket] = {}
+        self.paused_until: dict[str, float] = {}
+        self.stopped = Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                rows, sent = self.drain()
+            except Exception as e:
+                print(f"Delivery worker failed: {e}")
+                rows, sent = 0, 0
+            if not rows:
+                self.stopped.wait(self.idle_interval)
+            elif not sent:
+                # Everything due is rate limited; check back shortly
+                self.stopped.wait(0.25)
+
+    def stop(self):
+        self.stopped.set()
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(CHAT_PER_MINUTE / 60, max(1, CHAT_PER_MINUTE / 20))
+        return bucket
+
+    def _ready(self, chat_id: str) -> bool:
+        """Whether `chat_id` may be sent to now; takes a token from its bucket if so."""
+        return self.paused_until.get(chat_id, 0) <= monotonic() and self._chat_bucket(chat_id).consume()
+
+    def _sendable(self, row: Outbox, blocked: set) -> bool:
+        """
+        Whether `row` may be sent now. A chat that's rate limited, or whose last send failed,
+        goes into `blocked` so the rest of its rows wait too and stay in order.
+        """
+        if row.chat_id in blocked:
+            return False
+        if not self._ready(row.chat_id):
+            blocked.add(row.chat_id)
+            return False
+        return True
+
+    def drain(self) -> tuple[int, int]:
+        """
+        Try to send one batch of due outbox rows.
+        
+        Returns:
+            (rows, sent): How many rows were due, and how many of them were delivered.
+        """
+        session = SessionLocal()
+        try:
+            rows = pending_messages(session, self.batch_size)
+            blocked = set()
+            sent = 0
+            for row in rows:
+                if not self._sendable(row, blocked):
+                    continue
+                self.global_bucket.wait()
+                if self._send(row):
+                    sent += 1
+                else:
+                    blocked.add(row.chat_id)
+                session.commit()
+            return len(rows), sent
+        finally:
+            session.close()
+
+    def _send(self, row: Outbox) -> bool:
+        row.attempts += 1
+        start = perf_counter()
+        try:
+            try:
+                if row.media:
+                    self._send_media(row.chat_id, json.loads(row.media))
+                else:
+                    self.bot.send_message(row.chat_id, row.text, parse_mode=row.parse_mode)
+            except ApiTelegramException as e:
+                start = self._fallback(row, e, start)
+                self.bot.send_message(row.chat_id, row.fallback_text)
+        except Exception as e:
+            return self._send_failed(row, e, start)
+        return self._sent(row, start)
+
+    def _send_media(self, chat_id: str, urls: list[str]):
+        if len(urls) == 1:
+            self.bot.send_photo(chat_id, urls[0])
+        else:
+            self.bot.send_media_group(chat_id, [InputMediaPhoto(url) for url in urls])
+
+    # Outcome handling shared with async_engine.AsyncDeliveryWorker, whose _send() only
+    # differs in awaiting the bot
+    def _fallback(self, row: Outbox, e: Exception, start: float) -> float:
+        """
+        Re-raise `e` unless it's bad markdown with a plain-text rendering to fall back to.
+        Returns when the fallback send starts.
+        """
+        if getattr(e, "error_code", None) != 400 or not row.fallback_text:
+            raise e
+        print(f"Failed to send tweet: {e}")
+        observe_send(perf_counter() - start, "error")
+        return perf_counter()
+
+    def _send_failed(self, row: Outbox, e: Exception, start: float) -> bool:
+        if getattr(e, "error_code", None) == 429:
+            observe_send(perf_counter() - start, "throttled")
+            return self._throttled(row, e)
+        observe_send(perf_counter() - start, "error")
+        return self._failed(row, e)
+
+    def _sent(self, row: Outbox, start: float) -> bool:
+        observe_send(perf_counter() - start, "ok")
+        return self._delivered(row)
+
+    def _delivered(self, row: Outbox) -> bool:
+        observe_delivery(row.tweet_id)
+        row.delivered = datetime.utcnow()
+        return True
+
+    def _throttled(self, row: Outbox, e: Exception) -> bool:
+        retry_after = (e.result_json or {}).get("parameters", {}).get("retry_after", 1)
+        self.paused_until[row.chat_id] = monotonic() + retry_after
+        row.next_attempt = datetime.utcnow() + timedelta(seconds=retry_after)
+        # Being told to slow down isn't the message's fault
+        row.attempts -= 1
+        return False
+
+    def _failed(self, row: Outbox, e: Exception) -> bool:
+        print(f"Failed to deliver message {row.id}: {e}")
+        if row.attempts >= MAX_ATTEMPTS:
+            row.delivered = datetime.utcnow()
+            row.error = str(e)
+        else:
+            row.next_attempt = datetime.utcnow() + timedelta(seconds=min(2 ** row.attempts, 300))
+        return False
@@ -0,0 +1,295 @@
+"""
+Local stand-ins for the twitter241 RapidAPI endpoints and the Telegram Bot API.
+
+Both serve synthetic (or recorded) data over real HTTP so the bot can be run and measured
+without credentials. Point the bot at them with TWTTR_API_URL and TELEGRAM_API_URL.
+"""
+import json
+import random
+from collections import deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import path
+from threading import Event, Lock, Thread
+from time import perf_counter, sleep, time
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse, parse_qs
+from snowflake import TWITTER_EPOCH_MS, snowflake_ms
+
+TWITTER_DATE = "%a %b %d %H:%M:%S +0000 %Y"
+
+class FakeServer:
+    """
+    Threaded HTTP/1.1 server with injected latency and 429s. Subclasses implement handle().
+    With a `quota`, responses carry RapidAPI-style x-ratelimit-requests-* headers and every
+    request past the quota gets a 429.
+    """
+    def __init__(self, latency: float = 0, rate_429: float = 0, fixtures: Optional[str] = None, quota: Optional[int] = None):
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.fixtures = fixtures
+        self.quota = quota
+        self.remaining = quota
+        self.requests = 0
+        self.throttled = 0
+        self._lock = Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.httpd.daemon_threads = True
+        Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def handle(self, endpoint: str, params: Dict[str, str]) -> tuple[int, Any]:
+        raise NotImplementedError
+
+    def throttled_response(self) -> tuple[int, Any]:
+        return 429, {"message": "Too many requests"}
+
+    def fixture(self, endpoint: str) -> Optional[Any]:
+        """A recorded response for `endpoint`, if the fixtures directory has one."""
+        if not self.fixtures:
+            return None
+        file = path.join(self.fixtures, endpoint.strip("/").replace("/", "_") + ".json")
+        if not path.exists(file):
+            return None
+        with open(file) as f:
+            return json.load(f)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes; don't let Nagle delay the body
+            disable_nagle_algorithm = True
+
+            def _serve(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                length = int(self.headers.get("Content-Length", 0) or 0)
+                if length:
+                    body = self.rfile.read(length).decode()
+                    if self.headers.get("Content-Type", "").startswith("application/json"):
+                        params.update(json.loads(body))
+                    else:
+                        params.update({k: v[0] for k, v in parse_qs(body).items()})
+                headers = {}
+                with server._lock:
+                    server.requests += 1
+                    exhausted = server.quota is not None and server.remaining <= 0
+                    if server.quota is not None:
+                        server.remaining = max(0, server.remaining - 1)
+                        headers = {
+                            "x-ratelimit-requests-limit": str(server.quota),
+                            "x-ratelimit-requests-remaining": str(server.remaining),
+                            "x-ratelimit-requests-reset": "60",
+                        }
+                if server.latency:
+                    sleep(server.latency)
+                if exhausted or (server.rate_429 and random.random() < server.rate_429):
+                    with server._lock:
+                        server.throttled += 1
+                    status, payload = server.throttled_response()
+                else:
+                    status, payload = server.handle(url.path, params)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = _serve
+            do_POST = _serve
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+class FakeAccount:
+    __slots__ = ("uid", "screen_name", "statuses_count", "tweets")
+
+    def __init__(self, uid: str, screen_name: str, statuses_count: int, keep: int):
+        self.uid = uid
+        self.screen_name = screen_name
+        self.statuses_count = statuses_count
+        self.tweets: deque = deque(maxlen=keep)
+
+class FakeRapidAPI(FakeServer):
+    """
+    Stand-in for twitter241.p.rapidapi.com serving /get-users, /user-tweets, /tweet and /user.
+    
+    Accounts are synthetic; call tick() to make a share of them post new tweets.
+    A fixtures directory may hold recorded responses (e.g. user-tweets.json) served verbatim instead.
+    """
+    def __init__(self, accounts: int = 10, keep: int = 40, quote_rate: float = 0.1, **kwargs):
+        super().__init__(**kwargs)
+        self.quote_rate = quote_rate
+        self.accounts: Dict[str, FakeAccount] = {}
+        self.by_name: Dict[str, FakeAccount] = {}
+        self.tweets: Dict[str, dict] = {}
+        self._seq = 0
+        for i in range(accounts):
+            self.add_account(str(10_000_000 + i), f"bench_user_{i}", keep)
+
+    def add_account(self, uid: str, screen_name: str, keep: int = 40) -> FakeAccount:
+        account = FakeAccount(uid, screen_name, random.randint(100, 10_000), keep)
+        self.accounts[uid] = account
+        self.by_name[screen_name.lower()] = account
+        return account
+
+    def next_id(self) -> str:
+        # Real-looking snowflake: milliseconds since the Twitter epoch, then a sequence
+        with self._lock:
+            self._seq = (self._seq + 1) & 0x3FFFFF
+            return str((int(time() * 1000) - TWITTER_EPOCH_MS) << 22 | self._seq)
+
+    def post(self, account: FakeAccount, count: int = 1, thread: float = 0.3):
+        """Post `count` tweets; each may, with probability `thread`, reply to the one before it."""
+        previous = None
+        for _ in range(count):
+            tweet_id = self.next_id()
+            ms = snowflake_ms(tweet_id)
+            quoted = None
+            if self.tweets and random.random() < self.quote_rate:
+                quoted = random.choice(list(self.tweets)[-100:])
+            tweet = {
+                "id_str": tweet_id,
+                "created_at": datetime.fromtimestamp(ms / 1000, timezone.utc).strftime(TWITTER_DATE),
+                "full_text": f"Synthetic tweet {tweet_id} from @{account.screen_name}. #bench (1/1) - see https://example.com!",
+                "favorite_count": random.randint(0, 1000),
+                "retweet_count": random.randint(0, 100),
+                "user_id_str": account.uid,
+                "screen_name": account.screen_name,
+                "entities": {"media": [{"media_url_https": f"https://pbs.twimg.com/media/{tweet_id}.jpg"}] if random.random() < 0.2 else []},
+                "is_quote_status": quoted is not None,
+                "quoted_status_id_str": quoted,
+                "in_reply_to_status_id_str": previous if previous and random.random() < thread else None,
+            }
+            previous = tweet_id
+            account.tweets.appendleft(tweet)
+            account.statuses_count += 1
+            self.tweets[tweet_id] = tweet
+
+    def tick(self, active: float = 0.1, burst: int = 3):
+        """Make roughly `active` of the accounts post 1..`burst` tweets each."""
+        for account in self.accounts.values():
+            if random.random() < active:
+                self.post(account, random.randint(1, burst))
+
+    def handle(self, endpoint: str, params: Dict[str, str]) -> tuple[int, Any]:
+        recorded = self.fixture(endpoint)
+        if recorded is not None:
+            return 200, recorded
+        if endpoint == "/get-users":
+            users = [self._user(self.accounts[uid]) for uid in params.get("users", "").split(",") if uid in self.accounts]
+            return 200, {"result": {"data": {"users": [{"result": u} for u in users]}}}
+        if endpoint == "/user":
+            account = self.by_name.get(params.get("username", "").lower())
+            if not account:
+                return 200, {"result": {"data": {}}}
+            return 200, {"result": {"data": {"user": {"result": self._user(account)}}}}
+        if endpoint == "/tweet":
+            tweet = self.tweets.get(params.get("pid", ""))
+            if not tweet:
+                return 200, {}
+            return 200, {"tweet": tweet}
+        if endpoint == "/user-tweets":
+            account = self.accounts.get(params.get("user", ""))
+            if not account:
+                return 200, {"result": {"timeline": {"instructions": []}}}
+            return 200, self._timeline(account, int(params.get("count", 20)), params.get("cursor"))
+        return 404, {"message": "Endpoint does not exist"}
+
+    def _user(self, account: FakeAccount) -> dict:
+        return {
+            "rest_id": account.uid,
+            "legacy": {"screen_name": account.screen_name, "statuses_count": account.statuses_count},
+        }
+
+    def _entry(self, account: FakeAccount, tweet: dict) -> dict:
+        return {
+            "entryId": f"tweet-{tweet['id_str']}",
+            "sortIndex": tweet["id_str"],
+            "content": {
+                "entryType": "TimelineTimelineItem",
+                "itemContent": {"tweet_results": {"result": {
+                    "rest_id": tweet["id_str"],
+                    "core": {"user_results": {"result": {"rest_id": account.uid, "legacy": {"screen_name": account.screen_name}}}},
+                    "legacy": {k: v for k, v in tweet.items() if k not in ("user_id_str", "screen_name")},
+                }}},
+            },
+        }
+
+    def _timeline(self, account: FakeAccount, count: int, cursor: Optional[str]) -> dict:
+        tweets = list(account.tweets)
+        if cursor:
+            tweets = [t for t in tweets if int(t["id_str"]) < int(cursor)]
+        page = tweets[:count]
+        entries = [self._entry(account, t) for t in page]
+        if page:
+            entries.append({
+                "entryId": f"cursor-top-{page[0]['id_str']}",
+                "sortIndex": page[0]["id_str"],
+                "content": {"entryType": "TimelineTimelineCursor", "value": str(int(page[0]["id_str"]) + 1), "cursorType": "Top"},
+            })
+        if len(tweets) > count:
+            entries.append({
+                "entryId": f"cursor-bottom-{page[-1]['id_str']}",
+                "sortIndex": page[-1]["id_str"],
+                "content": {"entryType": "TimelineTimelineCursor", "value": page[-1]["id_str"], "cursorType": "Bottom"},
+            })
+        instructions = [{"type": "TimelineClearCache"}]
+        if tweets and not cursor:
+            # Pin the account's oldest kept tweet, like a real profile would
+            instructions.append({"type": "TimelinePinEntry", "entry": self._entry(account, tweets[-1])})
+        instructions.append({"type": "TimelineAddEntries", "entries": entries})
+        return {"result": {"timeline": {"instructions": instructions}}}
+
+class FakeTelegram(FakeServer):
+    """
+    Stand-in for the Telegram Bot API. Every method succeeds (unless a 429 is injected);
+    sent messages are counted and replies are timestamped by the message they answer.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.sent = 0
+        self.replies: Dict[int, float] = {}
+        self.expected_replies = 0
+        self.replied = Event()
+
+    def throttled_response(self) -> tuple[int, Any]:
+        return 429, {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1", "parameters": {"retry_after": 1}}
+
+    def handle(self, endpoint: str, params: Dict[str, str]) -> tuple[int, Any]:
+        method = endpoint.rsplit("/", 1)[-1]
+        message = {"message_id": 1, "date": int(time()), "chat": {"id": 1, "type": "private"}, "text": params.get("text", "")}
+        if method in ("sendMessage", "sendMediaGroup"):
+            with self._lock:
+                self.sent += 1
+            reply_to = params.get("reply_to_message_id")
+            if not reply_to and params.get("reply_parameters"):
+                reply_to = json.loads(params["reply_parameters"]).get("message_id")
+            if reply_to:
+                with self._lock:
+                    self.replies[int(reply_to)] = perf_counter()
+                    if len(self.replies) >= self.expected_replies:
+                        self.replied.set()
+        if method == "sendMediaGroup":
+            return 200, {"ok": True, "result": [message]}
+        if method == "getChat":
+            return 200, {"ok": True, "result": {"id": 1, "type": "private"}}
+        if method == "getUpdates":
+            # No one is sending commands; answer like a long poll that timed out
+            sleep(min(float(params.get("timeout", 0) or 0), 1))
+            return 200, {"ok": True, "result": []}
+        return 200, {"ok": True, "result": message if method.startswith("send") else True}
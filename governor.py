@@ -0,0 +1,136 @@
+from os import environ
+from threading import Lock
+from time import monotonic, time
+from typing import Mapping, Optional
+import requests
+from ratelimit import TokenBucket
+from metrics import observe_refused, observe_circuit
+
+# Call priorities, most important first
+DETECT = 0    # /get-users change detection, baselines and user lookups for commands
+TIMELINE = 1  # /user-tweets for accounts that changed
+QUOTE = 2     # /tweet lookups for quoted tweets
+PRIORITY_NAMES = ("detect", "timeline", "quote")
+
+REQUESTS_PER_MINUTE = float(environ.get("TWTTR_REQUESTS_PER_MINUTE", 60))
+# Share of the bucket lower priorities must leave untouched for the ones above them
+TIMELINE_RESERVE = float(environ.get("TWTTR_TIMELINE_RESERVE", 0.1))
+QUOTE_RESERVE = float(environ.get("TWTTR_QUOTE_RESERVE", 0.3))
+# Consecutive failures that open the circuit, and seconds it stays open before a probe
+BREAKER_FAILURES = int(environ.get("TWTTR_BREAKER_FAILURES", 5))
+BREAKER_COOLDOWN = float(environ.get("TWTTR_BREAKER_COOLDOWN", 60))
+
+# RapidAPI reports the plan quota as x-ratelimit-requests-*, some providers add their own x-ratelimit-*
+REMAINING_HEADERS = ("x-ratelimit-requests-remaining", "x-ratelimit-remaining")
+RESET_HEADERS = ("x-ratelimit-requests-reset", "x-ratelimit-reset")
+# Reset values above this are unix timestamps, not seconds from now
+EPOCH_RESET = 1e9
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+class QuotaExhausted(requests.RequestException):
+    """The governor refused a call: out of quota for its priority, or the circuit is open."""
+
+class QuotaGovernor:
+    """
+    Decides whether a RapidAPI call may go out, shared by every endpoint in twitter.py.
+
+    Calls take a token from one requests-per-minute bucket. Lower priorities may only spend
+    it down to their reserve, so quote lookups stop first and change detection last. The
+    bucket is also capped at the quota the provider reports left in its x-ratelimit-* headers,
+    and an exhausted quota or a 429 pauses everything until the reported reset.
+
+    A circuit breaker opens after `failures` consecutive connection errors or 5xx responses.
+    While open every call is refused; after `cooldown` seconds a single probe is let through,
+    and its outcome closes the circuit again or restarts the cooldown.
+    """
+    def __init__(
+        self,
+        requests_per_minute: float = REQUESTS_PER_MINUTE,
+        reserves: tuple[float, ...] = (0, TIMELINE_RESERVE, QUOTE_RESERVE),
+        failures: int = BREAKER_FAILURES,
+        cooldown: float = BREAKER_COOLDOWN,
+    ):
+        self.bucket = TokenBucket(requests_per_minute / 60, requests_per_minute)
+        self.reserves = reserves
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.paused_until = 0.0
+        self._failed = 0
+        self._opened = 0.0
+        self._probing = False
+        self._lock = Lock()
+
+    def acquire(self, priority: int = DETECT):
+        """
+        Take a token for a call at `priority`, or raise QuotaExhausted without blocking.
+        """
+        with self._lock:
+            now = monotonic()
+            if self.state == OPEN:
+                if now - self._opened < self.cooldown:
+                    self._refuse(priority, "circuit_open")
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    self._refuse(priority, "circuit_open")
+                self._probing = True
+            elif now < self.paused_until:
+                self._refuse(priority, "quota_paused")
+            reserve = self.reserves[min(priority, len(self.reserves) - 1)] * self.bucket.capacity
+            if self.bucket.available() - 1 < reserve and not self._probing:
+                self._refuse(priority, "quota")
+            self.bucket.charge(1)
+
+    def record(self, status: Optional[int], headers: Mapping[str, str] = {}):
+        """
+        Feed back the outcome of an acquired call: its status and response headers,
+        or a None status if it failed without a response.
+        """
+        with self._lock:
+            self._probing = False
+            if status is not None:
+                self._read_headers(headers, status)
+            if status is None or status >= 500:
+                self._failed += 1
+                if self.state == HALF_OPEN or self._failed >= self.failures:
+                    self._opened = monotonic()
+                    self._set_state(OPEN)
+                return
+            self._failed = 0
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+
+    def _read_headers(self, headers: Mapping[str, str], status: int):
+        remaining = _first_number(headers, REMAINING_HEADERS)
+        reset = _first_number(headers, RESET_HEADERS)
+        if remaining is not None:
+            self.bucket.cap(remaining)
+        if reset is not None and reset > EPOCH_RESET:
+            # Some providers send the reset as a unix timestamp rather than seconds
+            reset = max(0, reset - time())
+        if status == 429 or (remaining is not None and remaining <= 0):
+            wait = reset or _first_number(headers, ("retry-after",)) or self.cooldown
+            self.paused_until = max(self.paused_until, monotonic() + wait)
+
+    def _refuse(self, priority: int, reason: str):
+        observe_refused(PRIORITY_NAMES[min(priority, len(PRIORITY_NAMES) - 1)], reason)
+        raise QuotaExhausted(f"RapidAPI call refused ({reason})")
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            print(f"RapidAPI circuit {state}")
+        self.state = state
+        observe_circuit(state)
+
+def _first_number(headers: Mapping[str, str], names: tuple[str, ...]) -> Optional[float]:
+    for name in names:
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return float(value)
+        except ValueError:
+            continue
+    return None
@@ -0,0 +1,153 @@
+"""
+Subscribe a chat to a whole list of Twitter/X accounts at once.
+
+Reads profile links or bare handles, one per line or separated by spaces or commas, or from
+one column of a CSV file. Handles already in the database are reused, the rest are looked up
+concurrently (each only once), and every account and subscription is written in one transaction.
+
+    python import_accounts.py accounts.txt --chat -1001234567890 --by alice
+    python import_accounts.py accounts.csv --column profile_url
+"""
+import argparse
+import csv
+import re
+from dataclasses import dataclass, field
+from os import environ
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import func
+from database import Bot, SessionLocal, upsert_watched_accounts, bump_version
+from registry import Subscription
+from twitter import get_handle, resolve_handles
+
+BARE_HANDLE = re.compile(r"^@?([A-Za-z0-9_]{1,15})$")
+SEPARATORS = re.compile(r"[\s,]+")
+# Failures listed in a summary before the rest are only counted
+MAX_LISTED_FAILURES = 20
+
+@dataclass(slots=True)
+class ImportResult:
+    added: List[str] = field(default_factory=list)
+    resubscribed: List[str] = field(default_factory=list)
+    already: List[str] = field(default_factory=list)
+    failed: List[Tuple[str, str]] = field(default_factory=list)
+    # Registry records of every account the chat is now subscribed to, and the version written
+    subscriptions: List[Subscription] = field(default_factory=list)
+    version: Optional[int] = None
+
+    def summary(self) -> str:
+        lines = [
+            f"Subscribed to {len(self.added) + len(self.resubscribed)} accounts "
+            f"({len(self.added)} new, {len(self.resubscribed)} already watched), "
+            f"{len(self.already)} already subscribed, {len(self.failed)} failed."
+        ]
+        for link, reason in self.failed[:MAX_LISTED_FAILURES]:
+            lines.append(f"{link}: {reason}")
+        if len(self.failed) > MAX_LISTED_FAILURES:
+            lines.append(f"...and {len(self.failed) - MAX_LISTED_FAILURES} more")
+        return "\n".join(lines)
+
+def split_links(text: str) -> List[str]:
+    return [link for link in SEPARATORS.split(text) if link]
+
+def read_links(file: str, column: Optional[str] = None) -> List[str]:
+    """
+    Links from a text file, or from `column` of a CSV file: a header name, or a 0-based index
+    for a file without a header row.
+    """
+    with open(file, newline="") as f:
+        if column is None:
+            return split_links(f.read())
+        if column.isdigit():
+            return [row[int(column)].strip() for row in csv.reader(f) if len(row) > int(column) and row[int(column)].strip()]
+        return [row[column].strip() for row in csv.DictReader(f) if (row.get(column) or "").strip()]
+
+def _handle(link: str) -> str:
+    bare = BARE_HANDLE.match(link)
+    if bare:
+        return bare.group(1)
+    handle = get_handle(link)
+    if not BARE_HANDLE.match(handle):
+        raise ValueError("Not a Twitter/X profile link.")
+    return handle
+
+def import_links(links: Iterable[str], executor: str, chat_id: str) -> ImportResult:
+    """
+    Resolve `links` to accounts and subscribe `chat_id` to all of them in one transaction.
+    """
+    result = ImportResult()
+    chat_id = str(chat_id)
+    # Lowercased handle -> the link it first came from
+    handles: dict[str, str] = {}
+    for link in links:
+        try:
+            handles.setdefault(_handle(link).lower(), link)
+        except ValueError as e:
+            result.failed.append((link, str(e)))
+    if not handles:
+        return result
+
+    session = SessionLocal()
+    try:
+        known = {
+            row.username.lower(): row
+            for row in session.query(Bot.uid, Bot.username, Bot.last_count, Bot.last_id, Bot.last_checked)
+                .filter(func.lower(Bot.username).in_(list(handles)))
+        }
+        # Don't hold a connection open while the lookups run
+        session.rollback()
+        users = resolve_handles([handle for handle in handles if handle not in known])
+
+        accounts = []
+        for handle, link in handles.items():
+            row = known.get(handle)
+            if row is not None:
+                accounts.append({"uid": row.uid, "username": row.username, "last_count": row.last_count})
+                continue
+            user = users.get(handle)
+            if not user or not user.get("rest_id"):
+                result.failed.append((link, "Failed to find user."))
+                continue
+            legacy = user["legacy"]
+            accounts.append({"uid": user["rest_id"], "username": legacy["screen_name"], "last_count": legacy["statuses_count"]})
+
+        added, subscribed = upsert_watched_accounts(session, accounts, executor, chat_id)
+        # Registry records from the rows as written: reactivated accounts start from a fresh baseline
+        rows = {
+            row.uid: row
+            for row in session.query(Bot.uid, Bot.username, Bot.last_count, Bot.last_id, Bot.last_checked)
+                .filter(Bot.uid.in_([account["uid"] for account in accounts]))
+        }
+        subs = {account["uid"]: Subscription(*rows[account["uid"]]) for account in accounts}
+        result.version = bump_version(session)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+    for uid, sub in subs.items():
+        if uid in added:
+            result.added.append(sub.username)
+        elif uid in subscribed:
+            result.resubscribed.append(sub.username)
+        else:
+            result.already.append(sub.username)
+    result.subscriptions = list(subs.values())
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", help="text file of links or handles, or a CSV file with --column")
+    parser.add_argument("--column", help="CSV column holding the links: a header name, or a 0-based index for files without a header row")
+    parser.add_argument("--chat", default=environ.get("CHAT_ID", ""), help="chat to subscribe (default: CHAT_ID)")
+    parser.add_argument("--by", default="import", help="recorded as added_by")
+    args = parser.parse_args()
+    if not args.chat:
+        parser.error("--chat is required when CHAT_ID isn't set")
+
+    result = import_links(read_links(args.file, args.column), args.by, args.chat)
+    print(result.summary())
+
+if __name__ == "__main__":
+    main()
@@ -1,148 +1,307 @@
 from os import environ
 
-from database import Bot as Database, add_watched_account, SessionLocal
-from twitter import should_check_batch, get_tweets, get_user_from_handle, get_handle, get_baseline
+from database import Bot as Database, add_watched_account, SessionLocal, flush_account_state, enqueue_messages, bump_version, \
+    add_subscription, remove_subscription, ensure_default_subscriptions, get_account_states
+from delivery import DeliveryWorker
+from render import render_tweet, render_digest
+from polling import PollScheduler
+from sharding import Coordinator
+from registry import Registry, Subscription
+from dedup import DeliveredIndex
+from import_accounts import import_links, split_links
+from webhook import WebhookServer, TELEGRAM_MODE
+from snowflake import snowflake_ms, datetime_ms
+from metrics import CycleTrace, DB_FLUSH_SECONDS, observe_send, start_metrics_server
+from twitter import governor, get_status_counts, fetch_timelines, chunk_uids, USERS_PER_REQUEST, FETCH_MAX, resolve_quotes, get_user_from_handle, get_handle, get_baseline
 from dotenv import load_dotenv
 from sched import scheduler
-from time import sleep, time
-from telebot import TeleBot
+from time import sleep, time, perf_counter
+from telebot import TeleBot, apihelper
 from threading import Thread
 from sqlalchemy import func
-from dateutil.parser import parse as parse_date
-from datetime import datetime, timezone, time as dTime, date
-
-def ensure_datetime(d):
-    """Convert a date (or datetime) into a datetime with time.min if needed."""
-    if isinstance(d, datetime):
-        return d
-    elif isinstance(d, date):
-        return datetime.combine(d, dTime.min)
-    return None
-    
-def to_utc_aware(dt: date | datetime) -> datetime:
-    """
-    Convert a date or datetime into an aware datetime in UTC.
-    - If dt is a date (with no time), combine it with the minimal time.
-    - If dt is a naive datetime, replace tzinfo with UTC.
-    - If dt is already offset-aware, convert it to UTC.
-    """
-    if isinstance(dt, date) and not isinstance(dt, datetime):
-        # Convert bare date to a naive datetime (midnight)
-        dt = datetime.combine(dt, dTime.min)
-    # Now dt is definitely a datetime object
-    if dt.tzinfo is None:
-        # Naive -> treat as UTC
-        return dt.replace(tzinfo=timezone.utc)
-    else:
-        # Aware -> convert to UTC
-        return dt.astimezone(timezone.utc)
+from datetime import datetime
+from typing import Optional
 
 s = scheduler(time, sleep)
 load_dotenv()
+if environ.get("TELEGRAM_API_URL"):
+    # Talk to a stand-in Bot API server instead of api.telegram.org
+    apihelper.API_URL = environ["TELEGRAM_API_URL"].rstrip("/") + "/bot{0}/{1}"
 bot = TeleBot(environ.get("TELEGRAM_TOKEN", ""))
+# Sized from the governor's bucket, which every RapidAPI call is charged to as it goes out
+poll_scheduler = PollScheduler(USERS_PER_REQUEST, budget=governor.bucket)
+registry = Registry()
+delivered_index = DeliveredIndex()
+# How often to look for accounts that are due; each account has its own interval
+POLL_TICK = float(environ.get("POLL_TICK", 15))
+# "single" sends one message per tweet, "digest" one coalesced message per author per cycle
+DELIVERY_MODE = environ.get("DELIVERY_MODE", "single").lower()
+# "threaded" runs the scheduler and worker threads below, "async" the asyncio engine in async_engine.py
+ENGINE = environ.get("ENGINE", "threaded").lower()
+# Accounts whose stored state is older than this many seconds at startup skip the tweets
+# they posted meanwhile instead of catching up on them
+BASELINE_MAX_AGE = float(environ.get("BASELINE_MAX_AGE", 3600))
+# Seconds between the startup baseline batches
+BASELINE_INTERVAL = float(environ.get("BASELINE_INTERVAL", 1))
+# Uids queued for a fresh baseline, only touched from the scheduler thread
+baseline_pending: set[str] = set()
 
 def check_accounts():
     try:
-        session = SessionLocal()
-        accounts = session.query(Database).filter(Database.active == True).all()
+        trace = CycleTrace()
+        registry.refresh()
+        # Other workers poll the accounts that hash to them; unsubscribed ones aren't polled
+        # Accounts still waiting for a fresh baseline are left to refresh_baselines
+        accounts = [
+            acc for acc in registry.subscriptions()
+            if acc.chats and coordinator.owns(acc.uid) and acc.uid not in baseline_pending
+        ]
+        poll_scheduler.sync(acc.uid for acc in accounts)
+        due = set(poll_scheduler.take())
+        accounts = [acc for acc in accounts if acc.uid in due]
+        if not accounts:
+            return
+        trace.mark("schedule")
     
-        for acc in accounts:
-            # Decide how many new tweets we might fetch
-            (account_uid, difference) = next(
-                should_check_batch([acc.uid], [float(acc.last_count)]),
-                (None, 0)
-            )
-            if not account_uid or difference <= 0:
-                continue  # Nothing new; skip
+        # One batched /get-users pass for every due account
+        uids = [acc.uid for acc in accounts]
+        counts = get_status_counts(uids)
+        # statuses_count goes down when tweets get deleted, so take the magnitude
+        deltas = {
+            acc.uid: abs(counts[acc.uid] - float(acc.last_count or 0))
+            for acc in accounts if acc.uid in counts
+        }
+        trace.mark("detect")
     
-            # Fetch tweets (cap difference in case it is huge)
-            tweets, ignored = get_tweets(account_uid, min(difference, 20))
-            if not tweets:
+        # Only accounts whose count moved need their timeline fetched
+        changed = [acc for acc in accounts if deltas.get(acc.uid, 0) > 0]
+        # Accounts the API didn't answer for aren't recorded; sync() makes them due again
+        for uid, delta in deltas.items():
+            poll_scheduler.record(uid, delta > 0)
+        # Fetch tweets in parallel (cap difference in case it is huge);
+        # results come back in the same order as `changed`.
+        timelines = fetch_timelines([
+            (acc.uid, min(int(deltas[acc.uid]), FETCH_MAX), acc.last_id)
+            for acc in changed
+        ])
+        trace.mark("fetch")
+    
+        # Accounts that didn't change still get their state (and last_checked) written
+        pending = [(acc, []) for acc in accounts if deltas.get(acc.uid) == 0]
+        for acc, timeline in zip(changed, timelines):
+            if timeline is None:
+                # Fetch failed or was refused: keep the old state so the change is seen again
                 continue
+            tweets, ignored = timeline
+            pending.append((acc, unseen_tweets(acc, tweets)))
+        trace.mark("filter")
     
-            # For each fetched tweet, compare creation time to acc.last_checked:
-            new_tweets_to_send = []
-            acc_last_checked_dt = ensure_datetime(acc.last_checked)  # Also a datetime
-            for tweet in tweets:
-                tweet_created = parse_date(tweet.created_at)   # Usually an offset-aware dt
-                acc_last_checked_dt = acc.last_checked            # Possibly naive
-                if not acc_last_checked_dt:
-                    acc_last_checked_dt = datetime.utcnow()       # or a default
-        
-                # Convert BOTH to UTC-aware
-                tweet_created_utc = to_utc_aware(tweet_created)
-                acc_last_checked_utc = to_utc_aware(acc_last_checked_dt)
-        
-                if tweet_created_utc <= acc_last_checked_utc:
-                    continue
-                if acc.last_id and float(acc.last_id) >= float(tweet.tweet_id):
-                    continue
-        
-                # Otherwise, send the tweet
-                session.query(Database).filter(Database.uid == acc.uid).update({"last_count": acc.last_count + 1, "last_checked": datetime.utcnow(), "last_id": tweet.tweet_id})
-                send_tweet(tweet.full_text, tweet.media, tweet.author, tweet.tweet_id, tweet.created_at)
-            
-            # Optionally, move last_checked to now (or to max tweet_created if you prefer).
-            # Using the newest tweet’s DateTime can help avoid edge cases.
-            if new_tweets_to_send:
-                # Pick the largest creation time among tweets you actually sent
-                newest_tweet_time = max(parse_date(t.created_at) for t in new_tweets_to_send)
-                acc.last_checked = max(acc.last_checked, newest_tweet_time)
-            else:
-                # If no tweets were sent, just update last_checked to now
-                acc.last_checked = datetime.utcnow()
+        # Resolve quoted tweets for the whole cycle at once (deduped, concurrent, cached)
+        resolve_quotes([tweet for _, new_tweets in pending for tweet in new_tweets])
+        trace.mark("quotes")
     
-        session.commit()
-        session.close()
+        session = SessionLocal()
+        try:
+            states, claimed = write_cycle(session, pending, counts, trace)
+            session.commit()
+        finally:
+            session.close()
+        delivered_index.remember(claimed)
+        registry.apply_states(states)
+        DB_FLUSH_SECONDS.observe(trace.mark("flush"))
+        trace.finish()
     except Exception as e:
         print(e)
-    s.enter(180, 1, check_accounts)
+    finally:
+        s.enter(POLL_TICK, 1, check_accounts)
     
-def set_baseline():
+def unseen_tweets(acc: Subscription, tweets: list) -> list:
     """
-    Just in case, set the baseline statuses_count for all active accounts and update it when the bot starts up. only fetching new tweets.
+    The tweets from a fetched timeline that are newer than the last one delivered. Until an
+    account has had a tweet delivered, the ones posted after it was last checked.
     """
-    session = SessionLocal()
-    accounts = session.query(Database).filter(Database.active == True).all()
-    baselines = get_baseline([str(a.uid) for a in accounts])
-    for (account, baseline) in baselines:
-        session.query(Database) \
-            .filter(Database.uid == account) \
-            .update({"last_count": baseline, "last_checked": datetime.utcnow()})
-    session.commit()
-    print("Updated all accounts' baseline statuses_count.")
-    session.close()
+    # Ids are exact: a tweet posted while the cycle was running is still newer than last_id,
+    # where it may already be older than the last_checked the cycle writes
+    if acc.last_id is not None:
+        return [tweet for tweet in tweets if int(tweet.tweet_id) > acc.last_id]
+    # Compare id-encoded creation times as exact integers
+    checked_ms = datetime_ms(acc.last_checked or datetime.utcnow())
+    return [tweet for tweet in tweets if snowflake_ms(tweet.tweet_id) > checked_ms]
+
+def write_cycle(session, pending: list, counts: dict, trace: CycleTrace | None = None) -> tuple[list[dict], set]:
+    """
+    Render every account's new tweets and write them to the outbox together with the
+    accounts' new state, in the caller's transaction; the delivery worker sends from the outbox.
+    
+    :param pending: (account, new tweets newest first) pairs, for every account the API answered
+        for; accounts without new tweets only have their state written.
+    :param counts: uid -> the statuses_count the tweets were fetched for.
+    :return: (states, claimed): the account states written, for Registry.apply_states(), and the
+        (chat, tweet) pairs claimed, for DeliveredIndex.remember() once the caller has committed.
+    """
+    now = datetime.utcnow()
+    states = []
+    messages = []
+    # Claim each (chat, tweet) pair before rendering so a tweet that comes around
+    # again (after a restart, or via another worker) is never enqueued twice
+    claimed = delivered_index.claim(session, [
+        (chat_id, int(tweet.tweet_id))
+        for acc, new_tweets in pending for tweet in new_tweets for chat_id in acc.chats
+    ])
+    for acc, new_tweets_to_send in pending:
+        # Timelines come newest first; deliver oldest first
+        oldest_first = list(reversed(new_tweets_to_send))
+        # Chats normally all get the same tweets: render once per distinct set
+        rendered_for = {}
+        for chat_id in acc.chats:
+            tweets = [t for t in oldest_first if (chat_id, int(t.tweet_id)) in claimed]
+            key = tuple(t.tweet_id for t in tweets)
+            if key not in rendered_for:
+                rendered_for[key] = render_messages(tweets)
+            for message in rendered_for[key]:
+                messages.append({**message, "chat_id": chat_id})
+        last_id = max((int(t.tweet_id) for t in new_tweets_to_send), default=acc.last_id)
+        states.append({
+            "uid": acc.uid,
+            "last_id": last_id,
+            "last_count": counts[acc.uid],
+            "last_checked": now,
+        })
+    if trace:
+        trace.mark("render")
+
+    enqueue_messages(session, messages)
+    flush_account_state(session, states)
+    return states, claimed
+
+def render_messages(tweets) -> list[dict]:
+    """
+    Render one account's new tweets, oldest first, as outbox messages without a chat_id.
+    """
+    if not tweets:
+        return []
+    if DELIVERY_MODE == "digest":
+        return render_digest(tweets[0].author, tweets)
+    rendered = []
+    for tweet in tweets:
+        text, fallback = render_tweet(tweet.full_text, tweet.media, tweet.author, tweet.tweet_id, tweet.created_at)
+        rendered.append({
+            "tweet_id": tweet.tweet_id,
+            "text": text,
+            "fallback_text": fallback,
+            "parse_mode": "MarkdownV2",
+        })
+    return rendered
+
+def prune_delivered():
+    try:
+        delivered_index.prune()
+    except Exception as e:
+        print(e)
+    finally:
+        s.enter(24 * 60 * 60, 3, prune_delivered)
+
+def needs_baseline(acc: Subscription, now: datetime) -> bool:
+    """
+    Whether an account's stored state is missing or too old to catch up from. last_checked is
+    written for every account a poll cycle gets a statuses_count for, so it tells how long
+    the account went unpolled.
+    """
+    if acc.last_count is None or acc.last_checked is None:
+        return True
+    return (now - acc.last_checked).total_seconds() > BASELINE_MAX_AGE
+
+# The steps of a baseline run, shared with async_engine's baseline_loop; only the
+# database and /get-users calls between them differ
+def baseline_chunk() -> list[str]:
+    """
+    The next /get-users chunk of queued accounts this worker owns.
+    Dropped or unsubscribed accounts leave the queue, and so (once the ring is known) do
+    those another worker polls.
+    """
+    subs = registry.subscriptions()
+    baseline_pending.intersection_update(acc.uid for acc in subs if not coordinator.ready or coordinator.owns(acc.uid))
+    return next(chunk_uids([acc.uid for acc in subs if acc.uid in baseline_pending and coordinator.owns(acc.uid)]), [])
+
+def split_stale(stored: list) -> tuple[list[dict], dict[str, Optional[int]]]:
+    """
+    Split a chunk's re-read rows into the states that are current again (another worker polled
+    the account since startup) and the last_id of the accounts that still need a baseline.
+    """
+    now = datetime.utcnow()
+    current = [row._asdict() for row in stored if not needs_baseline(row, now)]
+    last_ids = {row.uid: row.last_id for row in stored if needs_baseline(row, now)}
+    return current, last_ids
+
+def baseline_states(last_ids: dict[str, Optional[int]], counts: dict[str, int]) -> list[dict]:
+    now = datetime.utcnow()
+    return [
+        {"uid": uid, "last_id": last_ids[uid], "last_count": count, "last_checked": now}
+        for uid, count in counts.items() if uid in last_ids
+    ]
+
+def baselines_written(chunk: list[str], current: list[dict], last_ids: dict[str, Optional[int]], states: list[dict]):
+    """
+    Mirror a committed baseline run into the registry and the queue.
+    """
+    registry.apply_states(current + states)
+    # Uids the API didn't return are retried on the next run
+    baseline_pending.difference_update(uid for uid in chunk if uid not in last_ids)
+    baseline_pending.difference_update(state["uid"] for state in states)
+    print(f"Updated {len(states)} accounts' baseline statuses_count, {len(baseline_pending)} to go.")
+
+def refresh_baselines():
+    """
+    Reset the statuses_count of accounts queued at startup, one /get-users chunk per run,
+    so they only pick up tweets posted from now on. Every other account is polled straight
+    away from the state restored from the database.
+    """
+    # Back off to the poll tick while none of the remaining accounts are ours (yet)
+    delay = POLL_TICK
+    try:
+        registry.refresh()
+        chunk = baseline_chunk()
+        if not chunk:
+            return
+        session = SessionLocal()
+        try:
+            current, last_ids = split_stale(get_account_states(session, chunk))
+        finally:
+            session.close()
+        states = baseline_states(last_ids, dict(get_baseline(list(last_ids))) if last_ids else {})
+        session = SessionLocal()
+        try:
+            flush_account_state(session, states)
+            session.commit()
+        finally:
+            session.close()
+        baselines_written(chunk, current, last_ids, states)
+        delay = BASELINE_INTERVAL
+    except Exception as e:
+        print(e)
+    finally:
+        if baseline_pending:
+            s.enter(delay, 3, refresh_baselines)
 
 def send_tweet(content: str, media: list[str], author: str, tid: str, timestamp: str):
+    """
+    Send a tweet straight to the chat, bypassing the outbox.
+    """
+    text, fallback = render_tweet(content, media, author, tid, timestamp)
+    start = perf_counter()
     try:
         bot.send_message(
             environ.get("CHAT_ID", ""), 
-            f"[{author}](https://x.com/{author}/status/{tid})" + (f": {content}" + '\n' + '\n'.join(media)) \
-                .replace(".", r"\.") \
-                .replace("-", r"\-") \
-                .replace("(", r"\(") \
-                .replace(")", r"\)") \
-                .replace("#", r"\#") \
-                .replace("!", r"\!") \
-                .replace(">", r"\>") \
-                .replace("~", r"\~") \
-                .replace("`", r"\`") \
-                .replace(":", r"\:") \
-                .replace("*", r"\*") \
-                .replace("_", r"\_") \
-                .replace("[", r"\[") \
-                .replace("]", r"\]") \
-                .replace("|", r"\|") \
-                .replace("{", r"\{") \
-                .replace("}", r"\}") \
-                .replace("+", r"\+"),
+            text,
             parse_mode="MarkdownV2",
         )
+        observe_send(perf_counter() - start, "ok")
     except Exception as e:
+        observe_send(perf_counter() - start, "throttled" if getattr(e, "error_code", None) == 429 else "error")
         print(f"Failed to send tweet: {e}")
         bot.send_message(
             environ.get("CHAT_ID", ""), 
-            f"{author}: {content}" + '\n' + '\n'.join(media) + "\n\n" + timestamp,
+            fallback,
         )
     
 @bot.message_handler(commands=["subscribe"])
@@ -151,31 +310,63 @@ def subscribe(message):
         session = SessionLocal()
         link = message.text.split(" ")[1]
         handle = get_handle(link)
-        if session.query(Database).filter(func.lower(Database.username) == handle.lower()).first():
-            session.query(Database).filter(func.lower(Database.username) == handle.lower()).update({"active": True})
+        chat_id = str(message.chat.id)
+        existing = session.query(Database).filter(func.lower(Database.username) == handle.lower()).first()
+        if existing:
+            added = add_subscription(session, existing.uid, chat_id, message.from_user.username)
+            # Read back the state add_subscription() left, which is reset if the account was inactive
+            sub = Subscription(*session.query(Database.uid, Database.username, Database.last_count, Database.last_id, Database.last_checked)
+                .filter(Database.uid == existing.uid).one())
+            version = bump_version(session)
             session.commit()
             session.close()
-            return bot.reply_to(message, f"resubscribed to {handle}")
+            registry.add_chat(sub, chat_id, version)
+            return bot.reply_to(message, f"resubscribed to {handle}" if added else f"Already subscribed to {handle}")
+        session.close()
         user = get_user_from_handle(handle)
         if not user: raise ValueError("Failed to get user.")
         uid = user["rest_id"]
         if not uid:
             bot.reply_to(message, "Failed to find user.")
             return
-        add_watched_account(uid, message.from_user.username, user)
+        version = add_watched_account(uid, message.from_user.username, user, chat_id)
+        registry.add_chat(Subscription(uid, user["legacy"]["screen_name"], user["legacy"]["statuses_count"], None, datetime.utcnow()), chat_id, version)
         bot.reply_to(message, f"Subscribed to {handle}")
     except Exception as e:
         bot.reply_to(message, f"Failed to subscribe: {e}")
     
+@bot.message_handler(commands=["subscribe_many"])
+def subscribe_many(message):
+    try:
+        # Everything after the command, across as many lines as were sent
+        parts = message.text.split(maxsplit=1)
+        links = split_links(parts[1]) if len(parts) > 1 else []
+        if not links:
+            bot.reply_to(message, "Send the links (or handles) after /subscribe_many, separated by spaces or new lines.")
+            return
+        chat_id = str(message.chat.id)
+        result = import_links(links, message.from_user.username, chat_id)
+        if result.version is not None:
+            registry.add_chats(result.subscriptions, chat_id, result.version)
+        bot.reply_to(message, result.summary())
+    except Exception as e:
+        bot.reply_to(message, f"Failed to subscribe: {e}")
+
 @bot.message_handler(commands=["unsubscribe"])
 def unsubscribe(message):
     session = SessionLocal()
     try:
         link = message.text.split(" ")[1]
         handle = get_handle(link)
-        # Case-insensitive update, if needed:
-        session.query(Database).filter(func.lower(Database.username) == handle.lower()).update({"active": False})
+        chat_id = str(message.chat.id)
+        # Case-insensitive lookup, if needed:
+        uids = [row.uid for row in session.query(Database.uid).filter(func.lower(Database.username) == handle.lower()).all()]
+        for uid in uids:
+            remove_subscription(session, uid, chat_id)
+        version = bump_version(session)
         session.commit()
+        for uid in uids:
+            registry.remove_chat(uid, chat_id, version)
         bot.reply_to(message, f"Unsubscribed from {handle}")
     except Exception as e:
         session.rollback()
@@ -185,9 +376,9 @@ def unsubscribe(message):
 
 @bot.message_handler(commands=["list"])
 def list_accounts(message):
-    session = SessionLocal()
     try:
-        accounts = session.query(Database).filter(Database.active == True).all()
+        registry.refresh()
+        accounts = registry.for_chat(message.chat.id)
         if not accounts:
             bot.reply_to(message, "No active subscriptions")
             return
@@ -195,12 +386,14 @@ def list_accounts(message):
         bot.reply_to(message, reply)
     except Exception as e:
         bot.reply_to(message, f"Failed to list: {e}")
-    finally:
-        session.close()
         
 @bot.message_handler(commands=["restart"])
 def restart(message):
     try:
+        if ENGINE == "async":
+            # The async engine's loops outlive their own errors and `s` never runs there
+            bot.reply_to(message, "Nothing to restart: the async engine keeps polling on its own.")
+            return
         bot.reply_to(message, "Restarting...")
         if not s.queue:
             s.enter(0, 5, check_accounts)
@@ -216,8 +409,69 @@ def verify_channel():
         print(f"Failed to verify channel: {e}")
         return False
   
-s.enter(30, 1, check_accounts) 
-s.enter(5, 2, verify_channel)
-s.enter(5, 3, set_baseline)
-Thread(target=bot.polling, kwargs={"non_stop":True}).start()
-Thread(target=s.run).start()
\ No newline at end of file
+delivery_worker = None
+webhook_server = None
+
+def start_telegram():
+    """
+    Run Telegram command handling and outbox delivery. Only the leader worker does this.
+    Commands arrive through the webhook server when TELEGRAM_MODE=webhook, and by long polling otherwise.
+    """
+    global delivery_worker, webhook_server
+    delivery_worker = DeliveryWorker(bot)
+    Thread(target=delivery_worker.run).start()
+    if TELEGRAM_MODE == "webhook":
+        try:
+            webhook_server = WebhookServer(bot)
+            webhook_server.start()
+            webhook_server.register()
+            print(f"Receiving updates by webhook on port {webhook_server.port}.")
+            return
+        except Exception as e:
+            print(f"Failed to start webhook, falling back to polling: {e}")
+            if webhook_server:
+                webhook_server.stop()
+                webhook_server = None
+            bot.remove_webhook()
+    Thread(target=bot.polling, kwargs={"non_stop":True}).start()
+
+def stop_telegram():
+    global webhook_server
+    if webhook_server:
+        webhook_server.stop()
+        webhook_server = None
+    else:
+        bot.stop_polling()
+    if delivery_worker:
+        delivery_worker.stop()
+
+coordinator = Coordinator(on_elected=start_telegram, on_deposed=stop_telegram, on_ring_change=registry.invalidate)
+
+def main():
+    start_metrics_server()
+    # Accounts added before per-chat subscriptions go to the CHAT_ID chat
+    ensure_default_subscriptions(environ.get("CHAT_ID", ""))
+    # Restore every account's state from the database and start polling right away;
+    # only accounts with missing or stale state wait for a baseline, in the background.
+    # Which of them this worker owns is only known after the first heartbeat, so
+    # refresh_baselines drops the others then
+    registry.load()
+    now = datetime.utcnow()
+    baseline_pending.update(acc.uid for acc in registry.subscriptions() if needs_baseline(acc, now))
+    Thread(target=delivered_index.warm, daemon=True).start()
+    s.enter(0, 1, check_accounts)
+    s.enter(0, 3, refresh_baselines)
+    s.enter(5, 2, verify_channel)
+    s.enter(60, 3, prune_delivered)
+    Thread(target=coordinator.run).start()
+    Thread(target=s.run).start()
+
+if __name__ == "__main__":
+    if ENGINE == "async":
+        # async_engine imports this module as `main`; let it share this copy
+        import sys
+        sys.modules["main"] = sys.modules["__main__"]
+        from async_engine import run
+        run()
+    else:
+        main()
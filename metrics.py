@@ -0,0 +1,112 @@
+"""
+Prometheus metrics for the poll -> parse -> deliver pipeline, served on METRICS_PORT.
+
+Set TRACE_SLOW_CYCLES to a number of seconds to print a per-stage breakdown of every poll
+cycle that takes longer than that, or register your own hook with add_trace_hook().
+"""
+from datetime import datetime, timezone
+from os import environ
+from time import perf_counter
+from typing import Callable, List, Optional, Tuple
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from snowflake import snowflake_ms
+
+METRICS_PORT = int(environ.get("METRICS_PORT", 0))
+METRICS_ADDR = environ.get("METRICS_ADDR", "127.0.0.1")
+TRACE_SLOW_CYCLES = environ.get("TRACE_SLOW_CYCLES")
+
+LAG_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+
+RAPIDAPI_REQUESTS = Counter("rapidapi_requests_total", "RapidAPI calls", ["endpoint", "status"])
+RAPIDAPI_SECONDS = Histogram("rapidapi_request_seconds", "RapidAPI call latency", ["endpoint"])
+RAPIDAPI_BYTES = Counter("rapidapi_response_bytes_total", "RapidAPI response body bytes", ["endpoint"])
+RAPIDAPI_REFUSED = Counter("rapidapi_refused_total", "RapidAPI calls the quota governor refused", ["priority", "reason"])
+RAPIDAPI_CIRCUIT = Gauge("rapidapi_circuit_open", "1 while the RapidAPI circuit breaker is open or probing")
+PARSE_SECONDS = Histogram("parse_tweets_seconds", "Time spent parsing one timeline")
+PARSE_TWEETS = Counter("parse_tweets_parsed_total", "Tweets parsed from timelines")
+PARSE_SKIPPED = Counter("parse_tweets_skipped_total", "Timeline entries skipped while parsing")
+DB_FLUSH_SECONDS = Histogram("db_flush_seconds", "Time to write a cycle's outbox rows and account state")
+TELEGRAM_SEND_SECONDS = Histogram("telegram_send_seconds", "Telegram send latency", ["result"])
+TELEGRAM_THROTTLED = Counter("telegram_throttled_total", "Telegram 429 responses")
+CYCLE_SECONDS = Histogram("poll_cycle_seconds", "Duration of a poll cycle", buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 180, 300))
+STAGE_SECONDS = Histogram("poll_stage_seconds", "Duration of each poll cycle stage", ["stage"])
+DETECTION_LAG = Histogram("detection_lag_seconds", "Time from a tweet being posted to it being delivered", buckets=LAG_BUCKETS)
+
+TraceHook = Callable[[List[Tuple[str, float]], float], None]
+_trace_hooks: List[TraceHook] = []
+
+def start_metrics_server(port: int = METRICS_PORT, addr: str = METRICS_ADDR) -> bool:
+    """Serve /metrics on `port`; does nothing when no port is configured."""
+    if not port:
+        return False
+    start_http_server(port, addr=addr)
+    print(f"Serving metrics on {addr}:{port}/metrics")
+    return True
+
+def observe_request(endpoint: str, status: int, seconds: float, size: int):
+    RAPIDAPI_REQUESTS.labels(endpoint, str(status)).inc()
+    RAPIDAPI_SECONDS.labels(endpoint).observe(seconds)
+    RAPIDAPI_BYTES.labels(endpoint).inc(size)
+
+def observe_refused(priority: str, reason: str):
+    RAPIDAPI_REFUSED.labels(priority, reason).inc()
+
+def observe_circuit(state: str):
+    RAPIDAPI_CIRCUIT.set(0 if state == "closed" else 1)
+
+def observe_parse(seconds: float, parsed: int, skipped: int):
+    PARSE_SECONDS.observe(seconds)
+    PARSE_TWEETS.inc(parsed)
+    PARSE_SKIPPED.inc(skipped)
+
+def observe_send(seconds: float, result: str):
+    TELEGRAM_SEND_SECONDS.labels(result).observe(seconds)
+    if result == "throttled":
+        TELEGRAM_THROTTLED.inc()
+
+def observe_delivery(tweet_id: Optional[str]):
+    """Record detection lag for a delivered tweet, using the time encoded in its snowflake id."""
+    if not tweet_id or not tweet_id.isdigit():
+        return
+    posted = snowflake_ms(tweet_id) / 1000
+    DETECTION_LAG.observe(max(0, datetime.now(timezone.utc).timestamp() - posted))
+
+def add_trace_hook(hook: TraceHook):
+    """
+    Call `hook(stages, total)` after every poll cycle, where stages is a list of (stage, seconds).
+    """
+    _trace_hooks.append(hook)
+
+def _print_slow_cycles(threshold: float) -> TraceHook:
+    def hook(stages: List[Tuple[str, float]], total: float):
+        if total < threshold:
+            return
+        breakdown = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in stages)
+        print(f"Slow poll cycle ({total:.2f}s): {breakdown}")
+    return hook
+
+if TRACE_SLOW_CYCLES:
+    add_trace_hook(_print_slow_cycles(float(TRACE_SLOW_CYCLES)))
+
+class CycleTrace:
+    """
+    Times the consecutive stages of one poll cycle. Call mark(stage) as each stage ends.
+    """
+    def __init__(self):
+        self.start = self.last = perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+
+    def mark(self, stage: str) -> float:
+        now = perf_counter()
+        elapsed = now - self.last
+        self.last = now
+        self.stages.append((stage, elapsed))
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        return elapsed
+
+    def finish(self) -> float:
+        total = perf_counter() - self.start
+        CYCLE_SECONDS.observe(total)
+        for hook in _trace_hooks:
+            hook(self.stages, total)
+        return total
@@ -0,0 +1,106 @@
+import heapq
+from os import environ
+from threading import Lock
+from time import monotonic
+from typing import Iterable, List, Optional
+from ratelimit import TokenBucket
+
+MIN_INTERVAL = float(environ.get("POLL_MIN_INTERVAL", 60))
+BASE_INTERVAL = float(environ.get("POLL_BASE_INTERVAL", 180))
+MAX_INTERVAL = float(environ.get("POLL_MAX_INTERVAL", 1800))
+BACKOFF = float(environ.get("POLL_BACKOFF", 2))
+REQUESTS_PER_MINUTE = float(environ.get("TWTTR_REQUESTS_PER_MINUTE", 60))
+
+class PollScheduler:
+    """
+    Keeps a next-due time per watched account in a heap.
+    
+    Accounts that just posted are polled every `min_interval` seconds, quiet ones back off
+    exponentially up to `max_interval`. Every RapidAPI call made for a cycle is charged to a
+    requests-per-minute bucket, and take() only hands out as many due accounts as the bucket
+    can pay for; the rest stay overdue and go first next time.
+    """
+    def __init__(
+        self,
+        users_per_request: int,
+        min_interval: float = MIN_INTERVAL,
+        base_interval: float = BASE_INTERVAL,
+        max_interval: float = MAX_INTERVAL,
+        backoff: float = BACKOFF,
+        requests_per_minute: float = REQUESTS_PER_MINUTE,
+        budget: Optional[TokenBucket] = None,
+    ):
+        self.users_per_request = users_per_request
+        self.min_interval = min_interval
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        # A shared bucket (e.g. the quota governor's) is charged by whoever makes the calls
+        self.budget = budget or TokenBucket(requests_per_minute / 60, requests_per_minute)
+        # (due, uid) entries; `_due` is authoritative and stale heap entries are skipped
+        self._heap: list[tuple[float, str]] = []
+        self._due: dict[str, float] = {}
+        self._interval: dict[str, float] = {}
+        self._lock = Lock()
+
+    def sync(self, uids: Iterable[str]):
+        """
+        Make the schedule match the active accounts: new ones are due now, removed ones are dropped.
+        Accounts taken but never recorded (their poll failed or was skipped) are due again, at the
+        interval they had.
+        """
+        now = monotonic()
+        uids = set(uids)
+        with self._lock:
+            for uid in uids - self._due.keys():
+                self._push(uid, now)
+                self._interval.setdefault(uid, self.base_interval)
+            for uid in self._interval.keys() - uids:
+                del self._interval[uid]
+                self._due.pop(uid, None)
+
+    def take(self, now: Optional[float] = None) -> List[str]:
+        """
+        Pop the accounts that are due, oldest first, as many as the request budget allows.
+        """
+        now = monotonic() if now is None else now
+        # Detection costs one /get-users call per chunk of accounts
+        limit = int(self.budget.available()) * self.users_per_request
+        taken: List[str] = []
+        with self._lock:
+            while self._heap and len(taken) < limit:
+                due, uid = self._heap[0]
+                if self._due.get(uid) != due:
+                    heapq.heappop(self._heap)
+                    continue
+                if due > now:
+                    break
+                heapq.heappop(self._heap)
+                del self._due[uid]
+                taken.append(uid)
+        return taken
+
+    def record(self, uid: str, active: bool, now: Optional[float] = None):
+        """
+        Reschedule an account after it was polled.
+        
+        :param active: Whether the account posted since the last poll.
+        """
+        now = monotonic() if now is None else now
+        with self._lock:
+            if uid not in self._interval:
+                # Unsubscribed while it was being polled
+                return
+            if active:
+                interval = self.min_interval
+            else:
+                interval = min(self._interval[uid] * self.backoff, self.max_interval)
+            self._interval[uid] = interval
+            self._push(uid, now + interval)
+
+    def _push(self, uid: str, due: float):
+        self._due[uid] = due
+        heapq.heappush(self._heap, (due, uid))
+
+    def __len__(self) -> int:
+        return len(self._due)
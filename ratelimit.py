@@ -0,0 +1,58 @@
+from threading import Lock
+from time import monotonic, sleep
+
+class TokenBucket:
+    """
+    Thread-safe token bucket holding up to `capacity` tokens, refilled at `rate` tokens per second.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+        self._lock = Lock()
+
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, n: float = 1) -> float:
+        """Seconds until `n` tokens are available (0 if they already are)."""
+        with self._lock:
+            self._refill()
+            if self.tokens >= n:
+                return 0
+            return (n - self.tokens) / self.rate
+
+    def consume(self, n: float = 1) -> bool:
+        """Take `n` tokens if available, without blocking."""
+        with self._lock:
+            self._refill()
+            if self.tokens < n:
+                return False
+            self.tokens -= n
+            return True
+
+    def wait(self, n: float = 1):
+        """Block until `n` tokens could be taken, then take them."""
+        while not self.consume(n):
+            sleep(self.delay(n))
+
+    def available(self) -> float:
+        """Tokens currently in the bucket (negative while paying off a charge)."""
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+    def charge(self, n: float = 1):
+        """Take `n` tokens unconditionally; the bucket may go into debt."""
+        with self._lock:
+            self._refill()
+            self.tokens -= n
+
+    def cap(self, n: float):
+        """Hold no more than `n` tokens right now, e.g. when the server says that's all that's left."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, n)
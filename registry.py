@@ -0,0 +1,162 @@
+from datetime import datetime
+from threading import Lock
+from typing import List, Optional, Tuple
+from sqlalchemy.orm import Session
+from database import Bot, ChatSubscription, SessionLocal, get_version
+
+class Subscription:
+    """
+    Compact, process-local copy of an active `bot` row and the chats subscribed to it.
+    """
+    __slots__ = ("uid", "username", "last_count", "last_id", "last_checked", "chats")
+
+    def __init__(
+        self,
+        uid: str,
+        username: str,
+        last_count,
+        last_id: Optional[int],
+        last_checked: Optional[datetime],
+        chats: Tuple[str, ...] = (),
+    ):
+        self.uid = uid
+        self.username = username
+        self.last_count = last_count
+        self.last_id = last_id
+        self.last_checked = last_checked
+        self.chats = chats
+
+    def __repr__(self):
+        return f"Subscription({self.uid!r}, {self.username!r})"
+
+class Registry:
+    """
+    In-memory registry of the active subscriptions.
+    
+    Loaded once, then kept current in place by this process' own writes. Every writer bumps
+    the "subscriptions" version counter in its transaction; refresh() compares it against the
+    version this copy reflects and only reloads when someone else changed the table.
+    """
+    def __init__(self):
+        self.version: Optional[int] = None
+        self._subs: dict[str, Subscription] = {}
+        self._lock = Lock()
+
+    def load(self, session: Optional[Session] = None):
+        """
+        Load the active accounts, in `session` if given (e.g. an async session's run_sync).
+        """
+        own = session is None
+        session = session or SessionLocal()
+        try:
+            version = get_version(session)
+            rows = session.query(Bot.uid, Bot.username, Bot.last_count, Bot.last_id, Bot.last_checked) \
+                .filter(Bot.active == True) \
+                .all()
+            chat_rows = session.query(ChatSubscription.uid, ChatSubscription.chat_id) \
+                .join(Bot, Bot.uid == ChatSubscription.uid) \
+                .filter(Bot.active == True) \
+                .all()
+        finally:
+            if own:
+                session.close()
+        chats: dict[str, list[str]] = {}
+        for uid, chat_id in chat_rows:
+            chats.setdefault(uid, []).append(chat_id)
+        subs = {row.uid: Subscription(*row, chats=tuple(chats.get(row.uid, ()))) for row in rows}
+        with self._lock:
+            self._subs = subs
+            self.version = version
+
+    def refresh(self, session: Optional[Session] = None) -> bool:
+        """
+        Reload if the table changed since the last load. Returns whether a reload happened.
+        """
+        if self.version is not None:
+            own = session is None
+            current = session or SessionLocal()
+            try:
+                if get_version(current) == self.version:
+                    return False
+            finally:
+                if own:
+                    current.close()
+        self.load(session)
+        return True
+
+    def subscriptions(self) -> List[Subscription]:
+        with self._lock:
+            return list(self._subs.values())
+
+    def for_chat(self, chat_id: str) -> List[Subscription]:
+        chat_id = str(chat_id)
+        with self._lock:
+            return [sub for sub in self._subs.values() if chat_id in sub.chats]
+
+    def add_chat(self, sub: Subscription, chat_id: str, version: int):
+        """
+        Record that `chat_id` subscribed to `sub`'s account; `sub` is used if the account isn't cached yet.
+        """
+        chat_id = str(chat_id)
+        with self._lock:
+            current = self._subs.setdefault(sub.uid, sub)
+            if chat_id not in current.chats:
+                current.chats = current.chats + (chat_id,)
+            self._track(version)
+
+    def add_chats(self, subs: List[Subscription], chat_id: str, version: int):
+        """
+        add_chat() for many accounts written in one transaction.
+        """
+        chat_id = str(chat_id)
+        with self._lock:
+            for sub in subs:
+                current = self._subs.setdefault(sub.uid, sub)
+                if chat_id not in current.chats:
+                    current.chats = current.chats + (chat_id,)
+            self._track(version)
+
+    def remove_chat(self, uid: str, chat_id: str, version: int):
+        """
+        Record that `chat_id` unsubscribed; the account is dropped once no chat is left.
+        """
+        chat_id = str(chat_id)
+        with self._lock:
+            current = self._subs.get(uid)
+            if current is not None:
+                current.chats = tuple(c for c in current.chats if c != chat_id)
+                if not current.chats:
+                    del self._subs[uid]
+            self._track(version)
+
+    def apply_states(self, states: list[dict]):
+        """
+        Mirror a flush_account_state() write into the cached records.
+        """
+        with self._lock:
+            for state in states:
+                sub = self._subs.get(state["uid"])
+                if sub is None:
+                    continue
+                for key in ("last_id", "last_count", "last_checked"):
+                    if key in state:
+                        setattr(sub, key, state[key])
+
+    def invalidate(self):
+        """
+        Force a reload on the next refresh(), e.g. when this worker takes over accounts whose
+        state another worker has been writing.
+        """
+        with self._lock:
+            self.version = -1
+
+    def __len__(self) -> int:
+        return len(self._subs)
+
+    def _track(self, version: int):
+        # Only our own write happened since the load: stay current without reloading.
+        # Otherwise someone else wrote too, so force a reload on the next refresh().
+        if self.version is not None and version == self.version + 1:
+            self.version = version
+        else:
+            self.version = -1
@@ -0,0 +1,108 @@
+from os import environ
+from cache import TTLCache
+from type import Tweet
+
+# Telegram rejects messages longer than this
+MESSAGE_LIMIT = 4096
+# send_media_group takes 2-10 items
+MEDIA_GROUP_LIMIT = 10
+
+# Characters MarkdownV2 reserves in plain text; each is escaped with a backslash.
+# The backslash itself goes first so the escapes added after it aren't doubled.
+MARKDOWN_SPECIAL = "\\_*[]()~`>#+-=|{}.!"
+_ESCAPE_TEXT = tuple((c, "\\" + c) for c in MARKDOWN_SPECIAL)
+# Inside the (...) part of a link only "\" and ")" need escaping
+_ESCAPE_URL = (("\\", "\\\\"), (")", "\\)"))
+
+def _escape(text: str, table: tuple[tuple[str, str], ...]) -> str:
+    # str.replace is C-speed and returns the string untouched when the character is
+    # absent; on tweet-sized text this beats str.translate and re.sub (see bench_render.py)
+    for char, escaped in table:
+        text = text.replace(char, escaped)
+    return text
+
+# Rendered single-tweet messages, so duplicates across accounts and cycles render once
+render_cache = TTLCache(
+    maxsize=int(environ.get("RENDER_CACHE_SIZE", 4096)),
+    ttl=float(environ.get("RENDER_CACHE_TTL", 3600)),
+)
+
+def escape_markdown(text: str) -> str:
+    """Escape text for Telegram MarkdownV2."""
+    return _escape(text, _ESCAPE_TEXT)
+
+def markdown_link(text: str, url: str) -> str:
+    """A MarkdownV2 inline link, with the label and URL each escaped by their own rules."""
+    return f"[{_escape(text, _ESCAPE_TEXT)}]({_escape(url, _ESCAPE_URL)})"
+
+def render_tweet(content: str, media: list[str], author: str, tid: str, timestamp: str) -> tuple[str, str]:
+    """
+    Render a tweet for Telegram. Results are cached by tweet id.
+    
+    Returns:
+        (text, fallback): The MarkdownV2 message, and a plain-text version to send
+            if Telegram rejects the markdown.
+    """
+    cached = render_cache.get(tid) if tid else None
+    if cached is not None:
+        return cached
+    body = f": {content}" + '\n' + '\n'.join(media)
+    text = markdown_link(author, f"https://x.com/{author}/status/{tid}") + escape_markdown(body)
+    fallback = f"{author}: {content}" + '\n' + '\n'.join(media) + "\n\n" + timestamp
+    if tid:
+        render_cache.set(tid, (text, fallback))
+    return text, fallback
+
+def _fold_threads(tweets: list[Tweet]) -> list[list[Tweet]]:
+    """Group tweets (oldest first) so each reply to a tweet in the list joins its parent's thread."""
+    threads: list[list[Tweet]] = []
+    thread_of: dict[str, list[Tweet]] = {}
+    for tweet in tweets:
+        thread = thread_of.get(tweet.reply_to_id) if tweet.reply_to_id else None
+        if thread is None:
+            thread = []
+            threads.append(thread)
+        thread.append(tweet)
+        thread_of[tweet.tweet_id] = thread
+    return threads
+
+def _split(text: str, size: int) -> list[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+def render_digest(author: str, tweets: list[Tweet]) -> list[dict]:
+    """
+    Coalesce one author's new tweets (oldest first) into as few messages as possible.
+    
+    Threads are folded into a single entry, text is packed into messages of at most
+    MESSAGE_LIMIT characters, and media is sent separately in groups of up to
+    MEDIA_GROUP_LIMIT. Returns outbox message dicts without a chat_id.
+    """
+    header = markdown_link(author, f"https://x.com/{author}") + escape_markdown(f": {len(tweets)} new tweet{'s' if len(tweets) != 1 else ''}")
+    header_fallback = f"{author}: {len(tweets)} new tweet{'s' if len(tweets) != 1 else ''}"
+
+    # (markdown, plain, tweet_id) blocks, each well under the limit
+    blocks: list[tuple[str, str, str]] = []
+    for thread in _fold_threads(tweets):
+        root = thread[0]
+        url = f"https://x.com/{author}/status/{root.tweet_id}"
+        content = "\n".join(t.full_text for t in thread)
+        # Escaping at most doubles the length, so halves always fit
+        for i, piece in enumerate(_split(content, MESSAGE_LIMIT // 2 - 100)):
+            link = markdown_link('🧵' if len(thread) > 1 else '›', url) + " " if i == 0 else ""
+            blocks.append((link + escape_markdown(piece), (url + "\n" if i == 0 else "") + piece, root.tweet_id))
+
+    messages: list[dict] = []
+    text, fallback, first_id = header, header_fallback, tweets[0].tweet_id if tweets else None
+    for block, plain, tweet_id in blocks:
+        if len(text) + len(block) + 2 > MESSAGE_LIMIT or len(fallback) + len(plain) + 2 > MESSAGE_LIMIT:
+            messages.append({"tweet_id": first_id, "text": text, "fallback_text": fallback, "parse_mode": "MarkdownV2"})
+            text, fallback, first_id = "", "", tweet_id
+        text = f"{text}\n\n{block}" if text else block
+        fallback = f"{fallback}\n\n{plain}" if fallback else plain
+    if text:
+        messages.append({"tweet_id": first_id, "text": text, "fallback_text": fallback, "parse_mode": "MarkdownV2"})
+
+    media = [url for t in tweets for url in t.media]
+    for i in range(0, len(media), MEDIA_GROUP_LIMIT):
+        messages.append({"tweet_id": None, "text": "", "media": media[i:i + MEDIA_GROUP_LIMIT]})
+    return messages
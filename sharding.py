@@ -0,0 +1,171 @@
+from bisect import bisect
+from datetime import datetime, timedelta
+from hashlib import blake2b
+from os import environ, getpid
+from socket import gethostname
+from threading import Event, Lock
+from typing import Callable, Iterable, Optional
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from database import SessionLocal, Worker, Lease
+
+SHARDING = environ.get("SHARDING", "").lower() in ("1", "true", "yes")
+WORKER_ID = environ.get("WORKER_ID") or f"{gethostname()}-{getpid()}"
+HEARTBEAT_INTERVAL = float(environ.get("WORKER_HEARTBEAT_INTERVAL", 10))
+WORKER_TTL = float(environ.get("WORKER_TTL", 30))
+VNODES = 64
+LEADER_LEASE = "telegram"
+
+def _hash(key: str) -> int:
+    return int.from_bytes(blake2b(key.encode(), digest_size=8).digest(), "big")
+
+class HashRing:
+    """
+    Consistent hash ring. When a worker joins or leaves, only ~1/N of the uids move.
+    """
+    def __init__(self, nodes: Iterable[str], vnodes: int = VNODES):
+        ring = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        self._keys = [h for h, _ in ring]
+        self._nodes = [node for _, node in ring]
+
+    def node_for(self, key: str) -> Optional[str]:
+        if not self._keys:
+            return None
+        return self._nodes[bisect(self._keys, _hash(key)) % len(self._keys)]
+
+class Coordinator:
+    """
+    Splits the watched accounts between every worker sharing DATABASE_URL.
+    
+    Each worker heartbeats into the worker table; the live ones form a consistent hash
+    ring over uids, so a dead worker's accounts move to the survivors once its heartbeat
+    is older than WORKER_TTL. One worker at a time holds the "telegram" lease and runs
+    Telegram command polling and outbox delivery; `on_elected` / `on_deposed` are called
+    when this worker gains or loses it, and `on_ring_change` whenever the set of live
+    workers (and so the accounts this worker owns) changes.
+    
+    With SHARDING off, the coordinator owns every account and is always the leader. With it on,
+    it owns none until its first heartbeat has shown which workers are live.
+    """
+    def __init__(
+        self,
+        worker_id: str = WORKER_ID,
+        enabled: bool = SHARDING,
+        on_elected: Optional[Callable[[], None]] = None,
+        on_deposed: Optional[Callable[[], None]] = None,
+        on_ring_change: Optional[Callable[[], None]] = None,
+    ):
+        self.worker_id = worker_id
+        self.enabled = enabled
+        self.on_elected = on_elected
+        self.on_deposed = on_deposed
+        self.on_ring_change = on_ring_change
+        self.leader = False
+        # Built by the first heartbeat; until then this worker doesn't know its share and owns nothing
+        self._ring: Optional[HashRing] = None
+        self._nodes: frozenset[str] = frozenset()
+        self._lock = Lock()
+        self.stopped = Event()
+
+    @property
+    def ready(self) -> bool:
+        """
+        Whether owns() reflects this worker's share yet.
+        """
+        return not self.enabled or self._ring is not None
+
+    def owns(self, uid: str) -> bool:
+        if not self.enabled:
+            return True
+        with self._lock:
+            ring = self._ring
+        return ring is not None and ring.node_for(uid) == self.worker_id
+
+    def run(self):
+        if not self.enabled:
+            self._set_leader(True)
+            return
+        while not self.stopped.is_set():
+            try:
+                self.heartbeat()
+            except SQLAlchemyError as e:
+                print(f"Heartbeat failed: {e}")
+            self.stopped.wait(HEARTBEAT_INTERVAL)
+
+    def stop(self):
+        self.stopped.set()
+        if self.enabled:
+            self._release()
+        self._set_leader(False)
+
+    def heartbeat(self):
+        """
+        Refresh this worker's heartbeat, rebuild the ring from the live workers and renew or take the lease.
+        """
+        now = datetime.utcnow()
+        session = SessionLocal()
+        try:
+            worker = session.get(Worker, self.worker_id)
+            if worker is None:
+                session.add(Worker(id=self.worker_id, started=now, heartbeat=now))
+            else:
+                worker.heartbeat = now
+            session.commit()
+
+            cutoff = now - timedelta(seconds=WORKER_TTL)
+            live = [w.id for w in session.query(Worker.id).filter(Worker.heartbeat >= cutoff).all()]
+            # Forget workers that have been gone for a while
+            session.query(Worker).filter(Worker.heartbeat < now - timedelta(seconds=WORKER_TTL * 10)).delete()
+            session.commit()
+        finally:
+            session.close()
+
+        nodes = frozenset(live or [self.worker_id])
+        changed = nodes != self._nodes
+        if changed:
+            with self._lock:
+                self._ring, self._nodes = HashRing(nodes), nodes
+        self._set_leader(self._acquire(now))
+        if changed and self.on_ring_change:
+            self.on_ring_change()
+
+    def _acquire(self, now: datetime) -> bool:
+        expires = now + timedelta(seconds=WORKER_TTL)
+        session = SessionLocal()
+        try:
+            taken = session.query(Lease) \
+                .filter(Lease.name == LEADER_LEASE) \
+                .filter((Lease.owner == self.worker_id) | (Lease.expires < now)) \
+                .update({"owner": self.worker_id, "expires": expires}, synchronize_session=False)
+            if not taken and session.get(Lease, LEADER_LEASE) is None:
+                session.add(Lease(name=LEADER_LEASE, owner=self.worker_id, expires=expires))
+                taken = 1
+            session.commit()
+            return bool(taken)
+        except IntegrityError:
+            # Another worker created the lease first
+            session.rollback()
+            return False
+        finally:
+            session.close()
+
+    def _release(self):
+        session = SessionLocal()
+        try:
+            session.query(Lease) \
+                .filter(Lease.name == LEADER_LEASE, Lease.owner == self.worker_id) \
+                .update({"expires": datetime.utcnow()}, synchronize_session=False)
+            session.query(Worker).filter(Worker.id == self.worker_id).delete()
+            session.commit()
+        except SQLAlchemyError as e:
+            print(f"Failed to release lease: {e}")
+        finally:
+            session.close()
+
+    def _set_leader(self, leader: bool):
+        if leader == self.leader:
+            return
+        self.leader = leader
+        callback = self.on_elected if leader else self.on_deposed
+        print(f"Worker {self.worker_id} {'is now' if leader else 'is no longer'} the Telegram leader.")
+        if callback:
+            callback()
@@ -0,0 +1,32 @@
+"""
+Ordering and timestamps for tweets, straight from their snowflake ids.
+
+A tweet id is (milliseconds since the Twitter epoch << 22) | worker/sequence bits, so ids
+sort in posting order and encode the posting time. Compare them as ints: 19-digit ids
+don't fit in a float's 53-bit mantissa.
+"""
+from datetime import datetime, timezone, time as dTime, date
+from typing import Union
+
+TWITTER_EPOCH_MS = 1288834974657
+
+def snowflake_ms(tweet_id: Union[str, int]) -> int:
+    """Unix time in milliseconds at which the tweet was created."""
+    return (int(tweet_id) >> 22) + TWITTER_EPOCH_MS
+
+def to_utc_aware(dt: date | datetime) -> datetime:
+    """
+    Convert a date or datetime into an aware datetime in UTC.
+    - If dt is a date (with no time), combine it with the minimal time.
+    - If dt is a naive datetime, replace tzinfo with UTC.
+    - If dt is already offset-aware, convert it to UTC.
+    """
+    if isinstance(dt, date) and not isinstance(dt, datetime):
+        dt = datetime.combine(dt, dTime.min)
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+def datetime_ms(dt: date | datetime) -> int:
+    """Unix time in milliseconds; naive datetimes are taken as UTC."""
+    return int(to_utc_aware(dt).timestamp() * 1000)
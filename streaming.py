@@ -0,0 +1,190 @@
+"""
+Streaming /user-tweets parsing, used when TWTTR_STREAM_TIMELINES is set.
+
+Response bodies are read incrementally with ijson instead of being loaded with .json(): only
+one timeline entry is built at a time, and Tweets are handed out as they are found. Older
+pages are requested lazily through the cursor-bottom entries until the last tweet already
+seen is reached, so catching up after downtime costs one entry's worth of memory per page
+however far behind an account is.
+"""
+from time import perf_counter
+from typing import BinaryIO, Dict, Iterator, List, Optional, Any
+import ijson
+from ijson.common import ObjectBuilder
+from governor import TIMELINE
+from metrics import observe_parse
+from type import Tweet
+from twitter import client, PAGE_SIZE, MAX_PAGES, _entry_tweet_id, _extract_tweet_from_entry, _is_module
+
+INSTRUCTION = "result.timeline.instructions.item"
+INSTRUCTION_TYPE = INSTRUCTION + ".type"
+ENTRY = INSTRUCTION + ".entries.item"
+PIN_ENTRY = INSTRUCTION + ".entry"
+# Some responses also carry the cursors at the top level
+BOTTOM_CURSOR = "cursor.bottom"
+
+class PageParser:
+    """
+    Incremental parse_tweets() for one page, fed the (prefix, event, value) triples of ijson.parse.
+
+    feed() returns the Tweets each event completed, newest first. Parsing is done once
+    `reached` is set (an entry at or below since_id turned up); call finish() at the end of
+    the body for a pinned tweet still held back. `bottom` is the cursor of the next, older page.
+    """
+    def __init__(self, since_id: Optional[int] = None, with_pinned: bool = True):
+        self.since_id = since_id
+        # Later pages repeat the pinned tweet; only the first page's counts
+        self.with_pinned = with_pinned
+        self.bottom: Optional[str] = None
+        self.reached = False
+        self.parsed = 0
+        self.skipped = 0
+        self._builder: Optional[ObjectBuilder] = None
+        self._building: Optional[str] = None
+        self._type: Optional[str] = None
+        self._pin_entry: Optional[Dict[str, Any]] = None
+        # A pinned tweet is held until the newest regular tweet shows whether it is newer
+        self._pinned: Optional[Tweet] = None
+        self._newest: Optional[int] = None
+
+    def feed(self, prefix: str, event: str, value: Any) -> List[Tweet]:
+        if self._builder is not None:
+            self._builder.event(event, value)
+            if prefix == self._building and event == "end_map":
+                entry, building = self._builder.value, self._building
+                self._builder = self._building = None
+                if building == ENTRY:
+                    return self._entry(entry)
+                self._pin_entry = entry
+            return []
+        if event == "start_map" and prefix in (ENTRY, PIN_ENTRY):
+            self._builder, self._building = ObjectBuilder(), prefix
+            self._builder.event(event, value)
+        elif prefix == INSTRUCTION:
+            # The type may come after the entry, so a pin is only handled once its instruction ends
+            if event == "start_map":
+                self._type = self._pin_entry = None
+            elif event == "end_map" and self._type == "TimelinePinEntry" and self._pin_entry is not None:
+                return self._pin(self._pin_entry)
+        elif prefix == INSTRUCTION_TYPE:
+            self._type = value
+        elif prefix == BOTTOM_CURSOR and event == "string":
+            self.bottom = value
+        return []
+
+    def finish(self) -> List[Tweet]:
+        pinned, self._pinned = self._pinned, None
+        if pinned is None:
+            return []
+        self.parsed += 1
+        return [pinned]
+
+    def _entry(self, entry: Dict[str, Any]) -> List[Tweet]:
+        content = entry.get("content", {})
+        if content.get("entryType") == "TimelineTimelineCursor":
+            if content.get("cursorType") == "Bottom":
+                self.bottom = content.get("value")
+            return []
+        if self.since_id is not None:
+            tweet_id = _entry_tweet_id(entry)
+            if tweet_id is not None and tweet_id <= self.since_id:
+                if _is_module(entry):
+                    # Placed by its newest reply, not the root it's parsed as: keep going
+                    self.skipped += 1
+                    return []
+                # Everything from here down is already seen
+                self.reached = True
+                self.skipped += 1
+                return self.finish()
+        tweet = _extract_tweet_from_entry(entry)
+        if tweet is None:
+            self.skipped += 1
+            return []
+        tweets = []
+        if self._newest is None:
+            self._newest = int(tweet.tweet_id)
+            pinned, self._pinned = self._pinned, None
+            if pinned is not None and int(pinned.tweet_id) >= self._newest:
+                tweets.append(pinned)
+            elif pinned is not None:
+                self.skipped += 1
+        tweets.append(tweet)
+        self.parsed += len(tweets)
+        return tweets
+
+    def _pin(self, entry: Dict[str, Any]) -> List[Tweet]:
+        self._pin_entry = None
+        tweet_id = _entry_tweet_id(entry)
+        if not self.with_pinned or (self.since_id is not None and tweet_id is not None and tweet_id <= self.since_id):
+            self.skipped += 1
+            return []
+        tweet = _extract_tweet_from_entry(entry)
+        if tweet is None:
+            self.skipped += 1
+            return []
+        if self._newest is None:
+            self._pinned = tweet
+            return []
+        # The pin came after the regular entries: keep it only if it's the newest
+        if int(tweet.tweet_id) >= self._newest:
+            self.parsed += 1
+            return [tweet]
+        self.skipped += 1
+        return []
+
+def next_cursor(parser: PageParser, cursor: Optional[str]) -> Optional[str]:
+    """
+    The cursor of the page to read after `parser`'s, or None if there's nothing more to catch up on.
+    """
+    if parser.reached or not parser.bottom or parser.bottom == cursor or not parser.parsed:
+        return None
+    return parser.bottom
+
+def page_params(uid: str, page_size: int, cursor: Optional[str]) -> Dict[str, Any]:
+    params = {"user": uid, "count": page_size}
+    if cursor:
+        params["cursor"] = cursor
+    return params
+
+def iter_page(body: BinaryIO, parser: PageParser) -> Iterator[Tweet]:
+    """
+    Feed a response body to `parser`, yielding Tweets as they are completed.
+
+    Raises:
+        ValueError: The body isn't valid JSON.
+    """
+    try:
+        for prefix, event, value in ijson.parse(body, use_float=True):
+            yield from parser.feed(prefix, event, value)
+            if parser.reached:
+                return
+    except ijson.JSONError as e:
+        raise ValueError(f"Malformed /user-tweets response: {e}") from e
+    yield from parser.finish()
+
+def stream_tweets(
+    uid: str,
+    since_id: Optional[int] = None,
+    page_size: int = PAGE_SIZE,
+    max_pages: int = MAX_PAGES,
+    timeout: Optional[float] = None,
+) -> Iterator[Tweet]:
+    """
+    Yield a user's tweets newest first, reading older pages only as the caller asks for more,
+    until since_id is reached, the timeline ends or `max_pages` pages have been read.
+    Stop iterating (e.g. with itertools.islice) to stop early; the open response is closed.
+
+    Raises:
+        requests.RequestException: A page couldn't be fetched or was refused by the governor.
+        ValueError: A page wasn't valid JSON.
+    """
+    cursor = None
+    for _ in range(max_pages):
+        parser = PageParser(since_id, with_pinned=cursor is None)
+        start = perf_counter()
+        with client.stream("/user-tweets", params=page_params(uid, page_size, cursor), timeout=timeout, priority=TIMELINE) as body:
+            yield from iter_page(body, parser)
+        observe_parse(perf_counter() - start, parser.parsed, parser.skipped)
+        cursor = next_cursor(parser, cursor)
+        if cursor is None:
+            return
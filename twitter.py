@@ -1,9 +1,16 @@
 import re
+from itertools import islice
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from os import environ
 from type import Tweet
+from client import RapidAPIClient
+from governor import QuotaGovernor, DETECT, TIMELINE, QUOTE
+from cache import TTLCache
+from metrics import observe_parse
+from time import perf_counter
 from urllib.parse import urlparse
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,47 +20,156 @@ HEADERS = {
     "x-rapidapi-key": KEY,
     "x-rapidapi-host": HOST
 }
-URL = "https://"+HOST
+# TWTTR_API_URL points the client at a stand-in server (see fakes.py)
+URL = environ.get("TWTTR_API_URL") or "https://"+HOST
+
+# /get-users takes a comma-separated list of ids. Keep each call under both the
+# endpoint's per-request user cap and a URL length proxies won't choke on.
+USERS_PER_REQUEST = int(environ.get("TWTTR_USERS_PER_REQUEST", 100))
+MAX_URL_LENGTH = int(environ.get("TWTTR_MAX_URL_LENGTH", 2000))
+BATCH_WORKERS = int(environ.get("TWTTR_BATCH_WORKERS", 4))
+# Timeline fetches run in their own pool, each request bounded by FETCH_TIMEOUT seconds.
+FETCH_WORKERS = int(environ.get("TWTTR_FETCH_WORKERS", 8))
+FETCH_TIMEOUT = float(environ.get("TWTTR_FETCH_TIMEOUT", 15))
+# Tweets asked for per /user-tweets page
+PAGE_SIZE = 20
+# Parse /user-tweets incrementally and follow older pages back to the last seen tweet (see streaming.py)
+STREAM_TIMELINES = environ.get("TWTTR_STREAM_TIMELINES", "0").lower() in ("1", "true", "yes")
+# Most tweets one account may catch up on per poll when streaming, and most pages read for them
+CATCHUP_MAX = int(environ.get("TWTTR_CATCHUP_MAX", 200))
+MAX_PAGES = int(environ.get("TWTTR_MAX_PAGES", 20))
+# Without streaming only the newest page is read
+FETCH_MAX = CATCHUP_MAX if STREAM_TIMELINES else PAGE_SIZE
+
+# One quota governor and pooled keep-alive client shared by every endpoint below
+governor = QuotaGovernor()
+client = RapidAPIClient(
+    URL,
+    HEADERS,
+    connect_timeout=float(environ.get("TWTTR_CONNECT_TIMEOUT", 5)),
+    read_timeout=float(environ.get("TWTTR_READ_TIMEOUT", 20)),
+    retries=int(environ.get("TWTTR_RETRIES", 3)),
+    backoff=float(environ.get("TWTTR_BACKOFF", 0.5)),
+    pool_size=max(BATCH_WORKERS, FETCH_WORKERS) * 2,
+    governor=governor,
+)
+
+# Handle lookups for bulk subscribes run this many at a time
+RESOLVE_WORKERS = int(environ.get("TWTTR_RESOLVE_WORKERS", 8))
+
+# Quoted tweets are resolved after parsing, and popular ones are quoted over and over.
+QUOTE_WORKERS = int(environ.get("TWTTR_QUOTE_WORKERS", 8))
+quote_cache = TTLCache(
+    maxsize=int(environ.get("TWTTR_QUOTE_CACHE_SIZE", 2048)),
+    ttl=float(environ.get("TWTTR_QUOTE_CACHE_TTL", 3600)),
+)
 
 def get_user_from_handle(handle: str):
-    req = requests.get(URL + "/user", params={"username": handle}, headers=HEADERS)
+    req = client.get("/user", params={"username": handle})
     try:
         return req.json()["result"]["data"]["user"]["result"]
     except KeyError:
         print(req.json())
         return
 
+def _get_user_from_handle_safe(handle: str) -> Optional[Dict[str, Any]]:
+    try:
+        return get_user_from_handle(handle)
+    except (ValueError, requests.RequestException) as e:
+        print(f"Failed to look up {handle}: {e}")
+        return None
+
+def resolve_handles(handles: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Look up several handles concurrently, each distinct handle (ignoring case) only once.
+    
+    Returns:
+        Dict[str, Optional[Dict[str, Any]]]: lowercased handle -> user result, or None if the lookup failed.
+    """
+    unique = list({handle.lower(): handle for handle in handles}.values())
+    if not unique:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(RESOLVE_WORKERS, len(unique))) as pool:
+        return {handle.lower(): user for handle, user in zip(unique, pool.map(_get_user_from_handle_safe, unique))}
+
 def get_tweet(tweet_id: str):
-    req = requests.get(URL + "/tweet", params={"pid": tweet_id}, headers=HEADERS)
+    req = client.get("/tweet", params={"pid": tweet_id}, priority=QUOTE)
     try:
-        data = req.json().get("tweet")
-        if not data:
-            raise ValueError("Failed to get tweet.")
-        if data.get("note_tweet", False):
-            return Tweet(
-                tweet_id,
-                created_at=data.get("created_at"),
-                full_text=data["note_tweet"]["note_tweet_results"]["result"]["text"],
-                favorite_count=data.get("favorite_count"),
-                retweet_count=data.get("retweet_count"),
-                author=data.get("user_id_str"),
-                media=[m["media_url_https"] for m in data["entities"].get("media", [])],
-                sort_index=data.get("sort_index")
-            )
-            
+        return tweet_from_response(tweet_id, req.json())
+    except KeyError:
+        print(req.json())
+        return
+
+def tweet_from_response(tweet_id: str, response: Dict[str, Any]) -> Tweet:
+    """
+    Build a Tweet from a /tweet response.
+    
+    Raises:
+        ValueError: The response has no tweet.
+        KeyError: The tweet is missing a required field.
+    """
+    data = response.get("tweet")
+    if not data:
+        raise ValueError("Failed to get tweet.")
+    if data.get("note_tweet", False):
         return Tweet(
             tweet_id,
             created_at=data.get("created_at"),
-            full_text=data["full_text"],
+            full_text=data["note_tweet"]["note_tweet_results"]["result"]["text"],
             favorite_count=data.get("favorite_count"),
             retweet_count=data.get("retweet_count"),
             author=data.get("user_id_str"),
             media=[m["media_url_https"] for m in data["entities"].get("media", [])],
             sort_index=data.get("sort_index")
         )
-    except KeyError:
-        print(req.json())
-        return
+        
+    return Tweet(
+        tweet_id,
+        created_at=data.get("created_at"),
+        full_text=data["full_text"],
+        favorite_count=data.get("favorite_count"),
+        retweet_count=data.get("retweet_count"),
+        author=data.get("user_id_str"),
+        media=[m["media_url_https"] for m in data["entities"].get("media", [])],
+        sort_index=data.get("sort_index")
+    )
+
+def _get_tweet_safe(tweet_id: str) -> Optional[Tweet]:
+    try:
+        return get_tweet(tweet_id)
+    except (ValueError, requests.RequestException):
+        return None
+
+def resolve_quotes(tweets: List[Tweet]) -> List[Tweet]:
+    """
+    Append the text of the quoted tweet to every quote tweet in `tweets`.
+    
+    Quoted ids are deduped across the whole list, cache misses are fetched concurrently,
+    and successful lookups are kept in `quote_cache` for later cycles.
+    Tweets are updated in place; the same list is returned for convenience.
+    """
+    quoted_ids = {t.quoted_id for t in tweets if t.quoted_id}
+    missing = [tid for tid in quoted_ids if quote_cache.get(tid) is None]
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(QUOTE_WORKERS, len(missing))) as pool:
+            for tid, quoted in zip(missing, pool.map(_get_tweet_safe, missing)):
+                if quoted:
+                    quote_cache.set(tid, quoted)
+    return apply_quotes(tweets)
+
+def apply_quotes(tweets: List[Tweet]) -> List[Tweet]:
+    """
+    Append each quoted tweet's text from `quote_cache`, or a note that it couldn't be fetched.
+    """
+    for tweet in tweets:
+        if not tweet.quoted_id:
+            continue
+        quoted_status = quote_cache.get(tweet.quoted_id)
+        if not quoted_status:
+            tweet.full_text = tweet.full_text + "\n[Failed to fetch original tweet]"
+        else: 
+            tweet.full_text = tweet.full_text + "\nOriginal Tweet:\n" + quoted_status.full_text
+    return tweets
 
 def get_handle(link: str) -> str:
     """
@@ -89,72 +205,159 @@ def get_handle(link: str) -> str:
     
     return handle    
 
-def get_tweets(uid: str, count: int = 20):
-    req = requests.get(URL + "/user-tweets", params={"user":uid,"count":count}, headers=HEADERS)
+def get_tweets(uid: str, count: int = PAGE_SIZE, timeout: Optional[float] = None, since_id: Optional[int] = None):
+    """
+    Fetch and parse a user's timeline, at most `count` tweets, newest first.
+    With TWTTR_STREAM_TIMELINES, up to `count` tweets are streamed from as many pages as it
+    takes to reach since_id; skips are then only counted in the parse metrics.
+    
+    Raises:
+        requests.RequestException: The call failed, was refused by the governor or returned an error status.
+        ValueError: The response wasn't a timeline.
+    """
+    if STREAM_TIMELINES:
+        # Imported here so ijson is only needed when streaming
+        from streaming import stream_tweets
+        tweets = list(islice(stream_tweets(uid, since_id, min(count, PAGE_SIZE), timeout=timeout), count))
+        return tweets, 0
+    req = client.get("/user-tweets", params={"user":uid,"count":count}, timeout=timeout, priority=TIMELINE)
+    req.raise_for_status()
+    try:
+        start = perf_counter()
+        tweets, skipped = parse_tweets(req.json(), since_id)
+        observe_parse(perf_counter() - start, len(tweets), skipped)
+        # The API may return more than asked for (e.g. a pinned tweet on top)
+        return tweets[:count], skipped
+    except KeyError as e:
+        raise ValueError(f"Unexpected /user-tweets response (missing {e})") from e
+
+def _get_tweets_safe(job: Tuple[str, int, Optional[int]]):
+    uid, count, since_id = job
     try:
-        return parse_tweets(req.json())
-    except KeyError:
-        print(req.json())
-        return [], 0
+        return get_tweets(uid, count, timeout=FETCH_TIMEOUT, since_id=since_id)
+    except (requests.RequestException, ValueError) as e:
+        print(f"Failed to fetch tweets for {uid}: {e}")
+        return None
+
+def fetch_timelines(jobs: List[Tuple[str, int, Optional[int]]]) -> List[Optional[Tuple[List[Tweet], int]]]:
+    """
+    Fetch the timelines of several accounts in parallel.
+    
+    Args:
+        jobs (List[Tuple[str, int, Optional[int]]]): (uid, count, since_id) triples, one per account.
+            since_id is the newest tweet id already seen, or None.
+    
+    Returns:
+        List[Optional[Tuple[List[Tweet], int]]]: get_tweets() results in the same order as `jobs`.
+            A failed, refused or timed out fetch yields None instead of raising.
+    """
+    if not jobs:
+        return []
+    with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(jobs))) as pool:
+        return list(pool.map(_get_tweets_safe, jobs))
     
 def get_most_recent_tweet(uid: str):
-    req = requests.get(URL + "/user-tweets", params={"user":uid,"count":1}, headers=HEADERS)
-    return parse_tweets(req.json())[0]
+    req = client.get("/user-tweets", params={"user":uid,"count":1}, priority=TIMELINE)
+    tweets, _ = parse_tweets(req.json())
+    return resolve_quotes(tweets[:1])[0]
     
 def should_check(uid: str, last: int) -> int:
     q = {"users": uid}
-    req = requests.get(URL + "/get-users", params=q, headers=HEADERS)
+    req = client.get("/get-users", params=q)
     user = req.json()["result"]["data"]["users"][0]["result"]
     return user["legacy"]["statuses_count"] - last
     
-def should_check_batch(uids: list[str], counts: list[int]):
-    if len(uids) != len(counts):
-        raise ValueError("uids and counts must be the same length")
-    if not uids:
-        return []
-    q = {"users": ",".join(uids)}
-    req = requests.get(URL + "/get-users", params=q, headers=HEADERS)
-    for user in req.json()["result"]["data"]["users"]:
-        # Why does the count turn fucking negative???
-        c = user["result"]["legacy"]["statuses_count"] - counts[uids.index(user["result"]["rest_id"])]
-        yield (user["result"]["rest_id"], c * -1 if c < 0 else c)
-        
+def chunk_uids(uids: List[str]):
+    """
+    Split uids into chunks that each fit in a single /get-users request.
+    """
+    base = len(URL + "/get-users?users=")
+    chunk: List[str] = []
+    length = base
+    for uid in uids:
+        # The comma separator is sent percent-encoded (%2C)
+        extra = len(uid) + (3 if chunk else 0)
+        if chunk and (len(chunk) >= USERS_PER_REQUEST or length + extra > MAX_URL_LENGTH):
+            yield chunk
+            chunk = []
+            length = base
+            extra = len(uid)
+        chunk.append(uid)
+        length += extra
+    if chunk:
+        yield chunk
+
+def _get_status_counts_chunk(uids: List[str]) -> Dict[str, int]:
+    try:
+        req = client.get("/get-users", params={"users": ",".join(uids)}, priority=DETECT)
+        return status_counts_from_response(req.json())
+    except (KeyError, ValueError, requests.RequestException) as e:
+        print(f"Failed to get status counts: {e}")
+        return {}
+
+def status_counts_from_response(response: Dict[str, Any]) -> Dict[str, int]:
+    """uid -> statuses_count for every user in a /get-users response."""
+    counts: Dict[str, int] = {}
+    for user in response["result"]["data"]["users"]:
+        result = user.get("result")
+        if not result:
+            continue
+        counts[result["rest_id"]] = result["legacy"]["statuses_count"]
+    return counts
+
+def get_status_counts(uids: List[str]) -> Dict[str, int]:
+    """
+    Fetch the current statuses_count for every uid, one /get-users call per chunk.
+    Chunks are requested concurrently.
+    
+    Returns:
+        Dict[str, int]: uid -> statuses_count. Users the API didn't return are missing.
+    """
+    chunks = list(chunk_uids(uids))
+    if not chunks:
+        return {}
+    counts: Dict[str, int] = {}
+    with ThreadPoolExecutor(max_workers=min(BATCH_WORKERS, len(chunks))) as pool:
+        for result in pool.map(_get_status_counts_chunk, chunks):
+            counts.update(result)
+    return counts
+
 def get_baseline(uids: list[str]):
-    if not uids:
-        return []
-    q = {"users": ",".join(uids)}
-    req = requests.get(URL + "/get-users", params=q, headers=HEADERS)
-    for user in req.json()["result"]["data"]["users"]:
-        c = user["result"]["legacy"]["statuses_count"]
-        yield (user["result"]["rest_id"], c)
-        
+    """
+    Yield (uid, statuses_count) for every uid the API returns, chunked like get_status_counts.
+    """
+    yield from get_status_counts(uids).items()
+
+
 def get_user_info(uid: str):
     q = {"users": uid}
-    req = requests.get(URL + "/get-users", params=q, headers=HEADERS)
+    req = client.get("/get-users", params=q)
     try:
         user = req.json()["result"]["data"]["users"][0]["result"]
         return user
     except:
         print(req.json())
         
-def parse_tweets(api_response: Dict[str, Any]) -> (List[Tweet], int):
+def parse_tweets(api_response: Dict[str, Any], since_id: Optional[int] = None) -> (List[Tweet], int):
     """
     Parses the API response to return the newest tweets from a user, ignoring older pinned tweets.
     
     Args:
         api_response (Dict[str, Any]): The JSON/dictionary response from Twitter’s API.
+        since_id (Optional[int]): The newest tweet id already seen. Timeline entries come newest
+            first, so parsing stops at the first entry at or below it, and no Tweet is built for
+            seen tweets (including an old pinned one).
     
     Returns:
         (tweets, skipped_count):
             tweets (List[Tweet]): The list of parsed Tweet objects, newest first.
-            skipped_count (int): How many tweets were skipped (e.g., invalid entries or older pinned).
+            skipped_count (int): How many tweets were skipped (e.g., invalid entries, older pinned or already seen).
     """
     # The main timeline instructions
     instructions = api_response["result"]["timeline"]["instructions"]
 
     timeline_tweets: List[Tweet] = []
     pinned_tweet: Optional[Tweet] = None
-    pinned_sort_index: Optional[str] = None
 
     # Track how many entries we skip
     skipped_count = 0
@@ -162,7 +365,19 @@ def parse_tweets(api_response: Dict[str, Any]) -> (List[Tweet], int):
     # 1) For “TimelineAddEntries,” parse tweets from each entry
     for instruction in instructions:
         if instruction.get("type") == "TimelineAddEntries":
-            for entry in instruction.get("entries", []):
+            entries = instruction.get("entries", [])
+            for i, entry in enumerate(entries):
+                if since_id is not None:
+                    tweet_id = _entry_tweet_id(entry)
+                    if tweet_id is not None and tweet_id <= since_id:
+                        if _is_module(entry):
+                            # A conversation is placed by its newest reply, not the (older) root
+                            # it's parsed as, so newer entries may still follow it
+                            skipped_count += 1
+                            continue
+                        # Everything from here down is already seen
+                        skipped_count += len(entries) - i
+                        break
                 maybe_tweet = _extract_tweet_from_entry(entry)
                 if maybe_tweet is not None:
                     timeline_tweets.append(maybe_tweet)
@@ -172,7 +387,11 @@ def parse_tweets(api_response: Dict[str, Any]) -> (List[Tweet], int):
         elif instruction.get("type") == "TimelinePinEntry":
             pinned_entry = instruction.get("entry")
             if pinned_entry:
-                pinned_sort_index = pinned_entry.get("sortIndex", "")
+                if since_id is not None:
+                    tweet_id = _entry_tweet_id(pinned_entry)
+                    if tweet_id is not None and tweet_id <= since_id:
+                        skipped_count += 1
+                        continue
                 maybe_tweet = _extract_tweet_from_entry(pinned_entry)
                 if maybe_tweet is not None:
                     pinned_tweet = maybe_tweet
@@ -183,21 +402,44 @@ def parse_tweets(api_response: Dict[str, Any]) -> (List[Tweet], int):
     if not timeline_tweets and not pinned_tweet:
         return ([], skipped_count)
 
-    # Determine the max sort_index among normal timeline tweets
-    max_sort_index = max((t.sort_index for t in timeline_tweets), default="")
+    # Determine the newest id among normal timeline tweets
+    max_id = max((int(t.tweet_id) for t in timeline_tweets), default=0)
 
-    # 4) Only add pinned_tweet if its sortIndex is >= the highest sortIndex of normal tweets
-    if pinned_tweet and pinned_sort_index and pinned_sort_index >= max_sort_index:
+    # 4) Only add pinned_tweet if it is at least as new as the newest normal tweet
+    if pinned_tweet and int(pinned_tweet.tweet_id) >= max_id:
         timeline_tweets.append(pinned_tweet)
     elif pinned_tweet:
         # We skip pinned tweet if it’s not the newest
         skipped_count += 1
 
-    # 5) Sort tweets by sort_index descending so the newest tweets come first
-    timeline_tweets.sort(key=lambda t: t.sort_index, reverse=True)
+    # 5) Sort tweets by id descending so the newest tweets come first
+    timeline_tweets.sort(key=lambda t: int(t.tweet_id), reverse=True)
 
     return (timeline_tweets, skipped_count)
 
+def _is_module(entry: Dict[str, Any]) -> bool:
+    return entry.get("content", {}).get("entryType") == "TimelineTimelineModule"
+
+def _entry_tweet_id(entry: Dict[str, Any]) -> Optional[int]:
+    """
+    The id of the tweet _extract_tweet_from_entry() would return for `entry`, found with
+    plain dict lookups so seen entries can be skipped without building a Tweet.
+    """
+    content = entry.get("content", {})
+    entry_type = content.get("entryType")
+    if entry_type == "TimelineTimelineModule":
+        for mod_item in content.get("items", []):
+            tweet_id = _entry_tweet_id(mod_item)
+            if tweet_id is not None:
+                return tweet_id
+        return None
+    if entry_type == "TimelineTimelineItem":
+        tweet_data = content.get("itemContent", {}).get("tweet_results", {}).get("result") or {}
+        id_str = (tweet_data.get("legacy") or {}).get("id_str")
+        if id_str and id_str.isdigit():
+            return int(id_str)
+    return None
+
 def _extract_tweet_from_entry(entry: Dict[str, Any]) -> Optional[Tweet]:
     """
     Helper function to parse a single entry into a Tweet. Returns None if invalid or not a tweet.
@@ -232,6 +474,8 @@ def _extract_tweet_from_entry(entry: Dict[str, Any]) -> Optional[Tweet]:
             return None
 
         tweet_id = legacy.get("id_str", "")
+        if not tweet_id.isdigit():
+            return None
         created_at = legacy.get("created_at", "")
         full_text = legacy.get("full_text", "")
         favorite_count = legacy.get("favorite_count", 0)
@@ -247,15 +491,12 @@ def _extract_tweet_from_entry(entry: Dict[str, Any]) -> Optional[Tweet]:
                           .get("media", [])
         media_urls = [m.get("media_url_https", "") for m in media]
     
+        reply_to_id = legacy.get("in_reply_to_status_id_str") or None
+
+        # Quoted tweets are fetched later, in bulk, by resolve_quotes()
+        quoted_id = None
         if legacy.get("is_quote_status"):
-            try:
-                quoted_status = get_tweet(legacy.get("quoted_status_id_str"))
-            except ValueError:
-                quoted_status = None
-            if not quoted_status:
-                full_text = full_text + "\n[Failed to fetch original tweet]"
-            else: 
-                full_text = full_text + "\nOriginal Tweet:\n" + quoted_status.full_text
+            quoted_id = legacy.get("quoted_status_id_str") or None
 
 
         return Tweet(
@@ -266,7 +507,9 @@ def _extract_tweet_from_entry(entry: Dict[str, Any]) -> Optional[Tweet]:
             retweet_count=retweet_count,
             author=screen_name,
             sort_index=sort_index,
-            media=media_urls
+            media=media_urls,
+            quoted_id=quoted_id,
+            reply_to_id=reply_to_id
         )
 
     return None
\ No newline at end of file
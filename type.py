@@ -1,8 +1,8 @@
 from dataclasses import dataclass
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
-@dataclass
+@dataclass(slots=True)
 class User:
     uid: str
     username: str
@@ -12,7 +12,7 @@ class User:
     added: datetime
     active: bool
 
-@dataclass
+@dataclass(slots=True)
 class Tweet:
     tweet_id: str
     created_at: str
@@ -21,4 +21,6 @@ class Tweet:
     retweet_count: int
     author: str
     media: List[str]
-    sort_index: str
\ No newline at end of file
+    sort_index: str
+    quoted_id: Optional[str] = None
+    reply_to_id: Optional[str] = None
\ No newline at end of file
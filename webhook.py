@@ -0,0 +1,81 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import environ
+from threading import Thread
+from typing import Optional
+from telebot import TeleBot
+from telebot.types import Update
+
+TELEGRAM_MODE = environ.get("TELEGRAM_MODE", "polling").lower()
+WEBHOOK_URL = environ.get("TELEGRAM_WEBHOOK_URL", "")
+WEBHOOK_LISTEN = environ.get("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(environ.get("WEBHOOK_PORT", 8443))
+WEBHOOK_PATH = environ.get("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = environ.get("WEBHOOK_SECRET", "")
+
+class WebhookServer:
+    """
+    Small HTTP server that receives Telegram updates and hands them to the bot's
+    registered @bot.message_handler functions, replacing long polling.
+    
+    Requests to any other path, or without the expected secret token header, are rejected.
+    """
+    def __init__(
+        self,
+        bot: TeleBot,
+        listen: str = WEBHOOK_LISTEN,
+        port: int = WEBHOOK_PORT,
+        path: str = WEBHOOK_PATH,
+        secret: str = WEBHOOK_SECRET,
+    ):
+        self.bot = bot
+        self.path = path
+        self.secret = secret
+        self.httpd = ThreadingHTTPServer((listen, port), self._handler())
+        self.thread: Optional[Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != server.path:
+                    return self._reply(404)
+                if server.secret and self.headers.get("X-Telegram-Bot-Api-Secret-Token") != server.secret:
+                    return self._reply(403)
+                try:
+                    body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                    update = Update.de_json(json.loads(body))
+                except (ValueError, KeyError, TypeError):
+                    return self._reply(400)
+                # Acknowledge first so Telegram isn't kept waiting on the handler
+                self._reply(200)
+                server.bot.process_new_updates([update])
+
+            def _reply(self, status: int):
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def register(self, url: str = WEBHOOK_URL):
+        """
+        Point Telegram at this server.
+        """
+        self.bot.set_webhook(url=url.rstrip("/") + self.path, secret_token=self.secret or None)
@@ -0,0 +1,82 @@
+"""
+Measure command latency and throughput of webhook mode without Telegram.
+
+Starts the stand-in Bot API server from fakes.py, runs the bot's WebhookServer against it and POSTs
+canned command updates, timing each one until the bot's reply reaches the stand-in.
+
+    python webhook_bench.py --updates 500 --concurrency 8 --command /list
+"""
+import argparse
+import json
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from os import environ, path
+from statistics import quantiles
+from time import perf_counter, time
+from urllib.request import Request, urlopen
+from fakes import FakeTelegram
+
+def canned_update(i: int, command: str) -> bytes:
+    return json.dumps({
+        "update_id": i,
+        "message": {
+            "message_id": i,
+            "date": int(time()),
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "bench", "username": "bench"},
+            "text": command,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command.split(" ")[0])}],
+        },
+    }).encode()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--command", default="/list")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--latency", type=float, default=0, help="seconds added to every Bot API response")
+    args = parser.parse_args()
+
+    stub = FakeTelegram(latency=args.latency)
+    stub.expected_replies = args.updates
+    environ["TELEGRAM_API_URL"] = stub.url
+    environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+    environ.setdefault("DATABASE_URL", "sqlite:///" + path.join(tempfile.mkdtemp(), "bench.db"))
+
+    # Imported late so the environment above is in place; main only registers handlers on import
+    import main as app
+    from webhook import WebhookServer
+
+    server = WebhookServer(app.bot, listen="127.0.0.1", port=0, path="/telegram", secret="bench")
+    server.start()
+    url = f"http://127.0.0.1:{server.port}/telegram"
+
+    sent: dict[int, float] = {}
+
+    def post(i: int):
+        req = Request(url, data=canned_update(i, args.command), headers={
+            "Content-Type": "application/json",
+            "X-Telegram-Bot-Api-Secret-Token": "bench",
+        })
+        sent[i] = perf_counter()
+        urlopen(req).read()
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(post, range(1, args.updates + 1)))
+    stub.replied.wait(args.timeout)
+    elapsed = perf_counter() - start
+    server.stop()
+
+    latencies = sorted((stub.replies[i] - sent[i]) * 1000 for i in sent if i in stub.replies)
+    if len(latencies) < 2:
+        print(f"Only {len(latencies)} of {args.updates} updates were answered.")
+        return
+    cuts = quantiles(latencies, n=100)
+    print(f"updates:    {len(latencies)}/{args.updates} answered")
+    print(f"throughput: {len(latencies) / elapsed:.1f} updates/s")
+    print(f"latency:    p50 {cuts[49]:.2f} ms, p99 {cuts[98]:.2f} ms, max {latencies[-1]:.2f} ms")
+
+if __name__ == "__main__":
+    main()